@@ -0,0 +1,248 @@
+from threading import Lock, get_ident
+from time import time
+
+import hashlib
+import logging
+import sqlite3
+import shutil
+import errno
+import fcntl
+import os
+
+class BLOBCACHE:
+    '''
+    content-addressed download cache shared by all download jobs (and processes) on a machine
+
+    files are kept once per content as `$cachedir/blobs/<sha256[:2]>/<sha256>[.<codec>]` (the sha256 of the
+    decoded body, and the codec of the stored file if it is compressed), and a sqlite index
+    `$cachedir/blobcache.sqlite` maps (url, codec) to contents; target paths are hard links to the cached files
+    (copies if the target is on another file system), so cached files are made read-only.
+    The least recently used contents are evicted once the cache grows beyond `maxbytes`,
+    evicting a content does not remove the hard links made from it
+
+    Initialize the object
+    Params:
+    ----------
+    cachedir: str
+        directory for the cache, created if it does not exist
+    maxbytes: int
+        disk budget of the cache
+    maxage: float or None
+        number of seconds a cached url is used without sending any request, None for always
+        (e.g. filings in the archives never change); stale urls are requested conditionally
+    '''
+    def __init__(
+        self,
+        cachedir,
+        maxbytes=50<<30,
+        maxage=None,
+        ):
+        self.logger = logging.getLogger('edgar.download')
+        self.cachedir = cachedir
+        self.maxbytes = maxbytes
+        self.maxage = maxage
+        os.makedirs(f'{self.cachedir}/blobs', exist_ok=True)
+        self.lockfname = f'{self.cachedir}/.evict.lock'
+        self.lock = Lock()
+        self.conn = sqlite3.connect(f'{self.cachedir}/blobcache.sqlite', timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS urls ('
+            'url TEXT, codec TEXT, sha TEXT, etag TEXT, lastmodified TEXT, fetched REAL, PRIMARY KEY (url, codec))'
+        )
+        self.conn.execute('CREATE TABLE IF NOT EXISTS blobs (sha TEXT PRIMARY KEY, size INTEGER, lastused REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS blobs_lastused ON blobs (lastused)')
+        self.conn.commit()
+        self._resetstats_()
+
+    def _resetstats_(self):
+        '''reset hit/miss/bytes-saved statistics'''
+        with self.lock:
+            self.stats = {'hit': 0, 'miss': 0, 'bytes_saved': 0, 'bytes_downloaded': 0}
+
+    def _blobpath_(self, sha):
+        return f'{self.cachedir}/blobs/{sha[:2]}/{sha}'
+
+    def _blobkey_(self, sha, codec=None):
+        '''key of a stored file, the sha256 of the decoded content and the codec it is stored with'''
+        return sha if codec is None else f'{sha}.{codec}'
+
+    def _entry_(self, url, codec=None):
+        '''(blob key, etag, lastmodified, fetched) of a url cached with `codec`, None if not cached'''
+        with self.lock:
+            return self.conn.execute(
+                'SELECT sha, etag, lastmodified, fetched FROM urls WHERE url = ? AND codec = ?', (url, codec or '')
+            ).fetchone()
+
+    def _fresh_(self, url, path, codec=None):
+        '''
+        link the cached content of `url` (stored with `codec`) to `path` without sending any request if it is fresh,
+        return True if linked
+        '''
+        entry = self._entry_(url, codec)
+        if entry is None or (self.maxage is not None and time() - entry[3] >= self.maxage):
+            return False
+        return self._linkhit_(url, entry[0], path)
+
+    def _condheaders_(self, url, codec=None):
+        '''headers for a conditional GET request, empty if the url is not cached with `codec`'''
+        entry = self._entry_(url, codec)
+        headers = {}
+        if entry is None:
+            return headers
+        if entry[1]:
+            headers['If-None-Match'] = entry[1]
+        if entry[2]:
+            headers['If-Modified-Since'] = entry[2]
+        return headers
+
+    def _hit_(self, url, path, codec=None):
+        '''the server says the cached content is not modified, link it to `path` and return True if linked'''
+        entry = self._entry_(url, codec)
+        if entry is None:
+            return False
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE urls SET fetched = ? WHERE url = ? AND codec = ?', (time(), url, codec or ''))
+        return self._linkhit_(url, entry[0], path)
+
+    def _linkhit_(self, url, sha, path):
+        '''link a cached content to `path` and count it as a hit'''
+        if not self._link_(url, sha, path):
+            return False
+        with self.lock:
+            self.stats['hit'] += 1
+            self.stats['bytes_saved'] += os.path.getsize(path)
+        return True
+
+    def _link_(self, url, sha, path):
+        '''
+        hard link (or copy) the content `sha` to `path`, return False if it has been evicted in the meantime
+        (or removed by hand), the urls pointing to it are forgotten then so they are requested in full again
+        '''
+        blobpath = self._blobpath_(sha)
+        tmppath = f'{path}.{os.getpid()}.{get_ident()}.link'
+        try:
+            try:
+                os.link(blobpath, tmppath)
+            except FileNotFoundError:
+                raise
+            except OSError as excpt:
+                ### another file system, or no hard links on this one
+                if excpt.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+                shutil.copyfile(blobpath, tmppath)
+            os.replace(tmppath, path)
+        except FileNotFoundError:
+            if os.path.exists(blobpath):
+                raise
+            self.logger.info(f'cached content of {url} has been evicted...')
+            self._forget_(sha)
+            return False
+        finally:
+            if os.path.lexists(tmppath):
+                os.remove(tmppath)
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE blobs SET lastused = ? WHERE sha = ?', (time(), sha))
+        return True
+
+    def _forget_(self, sha):
+        '''remove the records of a content whose file is gone, and of the urls pointing to it'''
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM urls WHERE sha = ?', (sha,))
+            self.conn.execute('DELETE FROM blobs WHERE sha = ?', (sha,))
+
+    def _put_(self, url, tmppath, path, headers, size, sha=None, codec=None):
+        '''
+        move a downloaded file into the cache (dropped if the same content is cached already),
+        record it for `url` and link it to `path`, return False if linking failed
+
+        Params:
+        ----------
+        url: str
+        tmppath: str
+            the downloaded (complete) file, it is moved or removed
+        path: str
+            target path
+        headers: dict
+            response headers, for `ETag`/`Last-Modified`
+        size: int
+            number of bytes downloaded
+        sha: str or None
+            sha256 of the decoded body, hashed while it was written; the file is hashed if not given
+            (only right for uncompressed files)
+        codec: str or None
+            codec the file is compressed with
+        '''
+        if sha is None:
+            digest = hashlib.sha256()
+            with open(tmppath, 'rb') as fp:
+                for chunk in iter(lambda: fp.read(1<<20), b''):
+                    digest.update(chunk)
+            sha = digest.hexdigest()
+        sha = self._blobkey_(sha, codec)
+        blobpath = self._blobpath_(sha)
+        os.makedirs(os.path.dirname(blobpath), exist_ok=True)
+        if os.path.exists(blobpath):
+            os.remove(tmppath)
+        else:
+            os.chmod(tmppath, 0o444)
+            os.replace(tmppath, blobpath)
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)', (sha, os.path.getsize(blobpath), time())
+            )
+            self.conn.execute(
+                'INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?, ?)',
+                (url, codec or '', sha, headers.get('ETag'), headers.get('Last-Modified'), time()),
+            )
+            self.stats['miss'] += 1
+            self.stats['bytes_downloaded'] += size
+        self._evict_(keep=sha)
+        return self._link_(url, sha, path)
+
+    def _evict_(self, keep=None):
+        '''
+        remove the least recently used contents (and their urls) until the cache fits in `maxbytes`
+        '''
+        with open(self.lockfname, 'a') as lockfp:
+            ### one process evicts at a time
+            fcntl.flock(lockfp, fcntl.LOCK_EX)
+            try:
+                with self.lock:
+                    total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+                    if total <= self.maxbytes:
+                        return
+                    evict = []
+                    for sha, size in self.conn.execute('SELECT sha, size FROM blobs ORDER BY lastused'):
+                        if total <= self.maxbytes:
+                            break
+                        if sha == keep:
+                            continue
+                        evict.append(sha); total -= size
+                    with self.conn:
+                        self.conn.executemany('DELETE FROM urls WHERE sha = ?', [(sha,) for sha in evict])
+                        self.conn.executemany('DELETE FROM blobs WHERE sha = ?', [(sha,) for sha in evict])
+                for sha in evict:
+                    try:
+                        os.remove(self._blobpath_(sha))
+                    except FileNotFoundError:
+                        pass
+                self.logger.info(f'{len(evict)} cached files evicted...')
+            finally:
+                fcntl.flock(lockfp, fcntl.LOCK_UN)
+
+    def _report_(self):
+        '''
+        log and return the statistics of this run
+        '''
+        with self.lock:
+            stats = dict(self.stats)
+        self.logger.info('shared cache hit: {}, miss: {}, {:.1f} MB saved, {:.1f} MB downloaded...'.format(
+            stats['hit'], stats['miss'], stats['bytes_saved'] / 1e6, stats['bytes_downloaded'] / 1e6
+        ))
+        return stats
+
+    def _close_(self):
+        '''close the cache'''
+        with self.lock:
+            self.conn.close()
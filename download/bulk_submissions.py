@@ -0,0 +1,210 @@
+# Build company filing dataframes from the SEC bulk submissions.zip
+
+from download import _parse_recent_json_, _parse_history_json_
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import argparse
+import tempfile
+import zipfile
+import json
+import os
+import re
+
+RECENT_MEMBER = re.compile(r'^CIK(\d{10})\.json$')
+
+def _list_companies(zippath, ciks=None):
+    '''
+    List recent submission members (`CIK##########.json`) in the zip file
+
+    Parameters:
+    ------------
+    zippath: str
+        Path for submissions.zip
+    ciks: list or None
+        Only keep these CIKs if given
+
+    Returns:
+    ------------
+    list of (cik, member name)
+    '''
+    if ciks is not None:
+        ciks = set('{:0>10}'.format(cik) for cik in ciks)
+    companies = []
+    with zipfile.ZipFile(zippath) as zf:
+        for name in zf.namelist():
+            match = RECENT_MEMBER.match(name)
+            if match is None:
+                continue
+            if ciks is not None and match.group(1) not in ciks:
+                continue
+            companies.append((match.group(1), name))
+    return companies
+
+def _ingest_companies(zippath, companies, outdir, storedir=None, replace=True):
+    '''
+    Parse the submission files of `companies` straight out of the zip file and save one dataframe per company
+
+    the output is the same as `COMPANYFILINGJSON`: `CIK*.submission.all.pickle` and `CIK*.submission.pages.json`,
+    typed filings are also saved to the parquet `FILINGSTORE` in `storedir` if given,
+    replacing the filings saved there before if `replace`
+
+    Returns:
+    ------------
+    list of (cik, number of filings, status), status is 1 for success, -1 for missing historical files, -2 for errors
+    '''
+    if storedir is not None:
+        from filingstore import FILINGSTORE
+        filingstore = FILINGSTORE(storedir)
+    results = []
+    with zipfile.ZipFile(zippath) as zf:
+        members = set(zf.namelist())
+        for cik, recentname in companies:
+            try:
+                with zf.open(recentname) as fp:
+                    recent_sub = json.load(fp)
+                recentdf, histfiles = _parse_recent_json_(recent_sub)
+                jsondflst = [recentdf]
+                histnames = [histfile['name'] for histfile in histfiles]
+                status = 1
+                for histname in histnames:
+                    if histname not in members:
+                        status = -1
+                        continue
+                    with zf.open(histname) as fp:
+                        jsondflst.append(_parse_history_json_(json.load(fp)))
+
+                jsondataframe = pd.concat(jsondflst).reset_index(drop=True)
+                jsondataframe.to_pickle(f'{outdir}/CIK{cik}.submission.all.pickle')
+                with open(f'{outdir}/CIK{cik}.submission.pages.json', 'w') as fp:
+                    json.dump(histnames, fp)
+                if storedir is not None:
+                    exchange = (recent_sub.get('exchanges') or [None])[0]
+                    filingstore._write_(jsondataframe, cik, exchange, replace=replace)
+                results.append((cik, len(jsondataframe), status))
+            except Exception as Excpt:
+                print(f'--Error in Ingesting CIK{cik} - {Excpt}--')
+                results.append((cik, 0, -2))
+    if storedir is not None:
+        filingstore._close_()
+    return results
+
+def _ingest_submissions_zip(zippath, outdir, ciks=None, maxworkers=None, batchsize=200, storedir=None):
+    '''
+    Build filing dataframes for all companies in submissions.zip in parallel
+
+    the zip file is read in place, nothing is extracted to the disk
+
+    Parameters:
+    ------------
+    zippath: str
+        Path for submissions.zip
+    outdir: str
+        Directory for saving the dataframes
+    ciks: list or None
+        Only ingest these CIKs if given
+    maxworkers: int or None
+        Number of processes, all cores by default
+    batchsize: int
+        Number of companies handled by a process at a time
+    storedir: str or None
+        Directory of the parquet `FILINGSTORE`, typed filings are saved there as well if given
+
+    Returns:
+    ------------
+    DataFrame with columns CIK, filings and status
+    '''
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    companies = _list_companies(zippath, ciks)
+    print(f'[info] {len(companies)} companies found in {zippath}')
+    batches = [companies[i:i+batchsize] for i in range(0, len(companies), batchsize)]
+
+    replace = True
+    if storedir is not None:
+        from filingstore import FILINGSTORE
+        filingstore = FILINGSTORE(storedir)
+        ### nothing to replace when building a store from scratch
+        replace = len(filingstore._partitions_()) > 0
+        filingstore._close_()
+
+    results = []
+    with ProcessPoolExecutor(max_workers=maxworkers) as executor:
+        futures = [executor.submit(_ingest_companies, zippath, batch, outdir, storedir, replace) for batch in batches]
+        for batchcount, future in enumerate(futures, 1):
+            results.extend(future.result())
+            print(f'[info] {batchcount}/{len(batches)} batches finished')
+
+    return pd.DataFrame(results, columns=['CIK', 'filings', 'status'])
+
+def _check_bulk_ingest():
+    '''
+    ingest a two-company submissions zip written to a temporary directory and check the results,
+    CIK0000000001 has all its historical files and CIK0000000002 misses one
+    '''
+    def _filings(year, count):
+        return {
+            'accessionNumber': [f'0000000000-{year % 100:02d}-{i:06d}' for i in range(count)],
+            'filingDate': [f'{year}-01-{i+1:02d}' for i in range(count)],
+            'form': ['10-K'] * count,
+            'primaryDocument': ['doc.htm'] * count,
+        }
+    members = {
+        'CIK0000000001.json': {
+            'cik': '1', 'exchanges': ['NYSE'],
+            'filings': {'recent': _filings(2020, 3), 'files': [{'name': 'CIK0000000001-submissions-001.json'}]},
+        },
+        'CIK0000000001-submissions-001.json': _filings(2010, 2),
+        'CIK0000000002.json': {
+            'cik': '2', 'exchanges': [],
+            'filings': {'recent': _filings(2021, 2), 'files': [{'name': 'CIK0000000002-submissions-001.json'}]},
+        },
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        zippath = f'{workdir}/submissions.zip'
+        with zipfile.ZipFile(zippath, 'w') as zf:
+            for name, content in members.items():
+                zf.writestr(name, json.dumps(content))
+        storedir = f'{workdir}/store'
+
+        from filingstore import FILINGSTORE
+        ### the second run replaces the filings of the first one in the store
+        for _ in range(2):
+            statusdf = _ingest_submissions_zip(zippath, f'{workdir}/out', maxworkers=2, batchsize=1, storedir=storedir)
+            statusdf = statusdf.sort_values('CIK').reset_index(drop=True)
+            assert statusdf['CIK'].tolist() == ['0000000001', '0000000002'], statusdf
+            assert statusdf['filings'].tolist() == [5, 2], statusdf
+            assert statusdf['status'].tolist() == [1, -1], statusdf
+            assert len(pd.read_pickle(f'{workdir}/out/CIK0000000001.submission.all.pickle')) == 5
+            filingstore = FILINGSTORE(storedir)
+            storecounts = filingstore._load_(columns=['cik'])['cik'].value_counts().to_dict()
+            filingstore._close_()
+            assert storecounts == {1: 5, 2: 2}, storecounts
+    print('[info] bulk ingestion check passed')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build company filing dataframes from the SEC bulk submissions.zip')
+    parser.add_argument('zippath', type=str, nargs='?', help='Path for submissions.zip')
+    parser.add_argument('outdir', type=str, nargs='?', help='Directory for saving the dataframes')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes, all cores by default')
+    parser.add_argument('--batch', type=int, default=200, help='Number of companies handled by a process at a time')
+    parser.add_argument('--store', type=str, default=None, help='Directory of the parquet filing store (optional)')
+    parser.add_argument('--index', type=str, default=None, help='Path for the sqlite filing index (optional)')
+    parser.add_argument('--check', action='store_true', help='Ingest a small generated zip file and check the results')
+
+    args = parser.parse_args()
+    if args.check:
+        _check_bulk_ingest()
+        raise SystemExit
+    if args.zippath is None or args.outdir is None:
+        parser.error('zippath and outdir are required')
+
+    statusdf = _ingest_submissions_zip(args.zippath, args.outdir, maxworkers=args.workers, batchsize=args.batch, storedir=args.store)
+    statusdf.to_pickle(f'{args.outdir}/bulk_status.pickle')
+    print('[info] {} companies ingested, {} with problems'.format(len(statusdf), (statusdf['status'] != 1).sum()))
+
+    if args.index is not None:
+        from filingindex import FILINGINDEX
+        filingindex = FILINGINDEX(args.index)
+        filingindex._index_pickles_(args.outdir)
+        filingindex._close_()
@@ -1,28 +1,272 @@
-from utils import _setlogger_
+from utils import _setlogger_, _openfile_, _compresswriter_
 
 import pandas as pd
 
 import requests
+import hashlib
 import logging
+import tempfile
+import sqlite3
 import json
 import os
 
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from time import sleep, monotonic, time
 from numpy import random
+from requests.adapters import HTTPAdapter
 
+EDGAR_HEADERS = {
+    "User-Agent": "Andy Wang (ztwang201605@gmail.com)",
+    "Accept-Encoding": "gzip, deflate",
+}
 
-def _download_url_(url, path, overwrite=True):
+_sharedsession = None
+_sessionlock = Lock()
+
+def _makesession_(maxconnections=4, maxhosts=10, headers=None):
+    '''
+    Make a keep-alive session with a connection pool
+
+    Params:
+    ----------
+    maxconnections: int
+        maximum number of connections kept for each host, requests wait for a free connection beyond that
+    maxhosts: int
+        number of hosts whose connection pools are kept alive
+    headers: dict or None
+        headers sent with every request, EDGAR_HEADERS by default
+    '''
+    session = requests.Session()
+    session.headers.update(EDGAR_HEADERS if headers is None else headers)
+    adapter = HTTPAdapter(
+        pool_connections=maxhosts,
+        pool_maxsize=maxconnections,
+        pool_block=True,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def _getsession_():
+    '''
+    Get the session shared by the whole module, make one if there isn't
+    '''
+    global _sharedsession
+    with _sessionlock:
+        if _sharedsession is None:
+            _sharedsession = _makesession_()
+        return _sharedsession
+
+class HTTPCACHE:
+    '''
+    object for keeping `ETag`/`Last-Modified` of downloaded urls, so that unchanged files are not downloaded again
+
+    entries are kept in a sqlite database (WAL mode) and written one url at a time as they change,
+    so several processes can share one cache file
+
+    Initialize the object
+    Params:
+    ----------
+    cachefname: str
+        sqlite file for the cache, created if it does not exist
+    maxage: float
+        number of seconds a downloaded file is treated as fresh (no request is sent at all), 0 for always asking the server
+    '''
+    def __init__(
+        self,
+        cachefname,
+        maxage=0,
+        ):
+        self.logger = logging.getLogger('edgar.download')
+        self.cachefname = cachefname
+        self.maxage = maxage
+        self.lock = Lock()
+        self.conn = sqlite3.connect(self.cachefname, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS urls ('
+            'url TEXT PRIMARY KEY, path TEXT, etag TEXT, lastmodified TEXT, fetched REAL, immutable INTEGER DEFAULT 0)'
+        )
+        self.conn.commit()
+        self._resetstats_()
+
+    def _resetstats_(self):
+        '''reset hit/miss/bytes-saved statistics'''
+        with self.lock:
+            self.stats = {'hit': 0, 'miss': 0, 'bytes_saved': 0, 'bytes_downloaded': 0}
+
+    def _entry_(self, url, path):
+        '''
+        get the cache entry (etag, lastmodified, fetched, immutable) for `url` if the file it points to is still at `path`
+        '''
+        with self.lock:
+            entry = self.conn.execute(
+                'SELECT path, etag, lastmodified, fetched, immutable FROM urls WHERE url = ?', (url,)
+            ).fetchone()
+        if entry is None or entry[0] != path or not os.path.exists(path):
+            return None
+        return entry[1:]
+
+    def _markimmutable_(self, url):
+        '''
+        mark `url` as immutable, it will never be requested again once it has been downloaded
+        '''
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT INTO urls (url, immutable) VALUES (?, 1) ON CONFLICT(url) DO UPDATE SET immutable = 1', (url,)
+            )
+
+    def _fresh_(self, url, path):
+        '''
+        check if the downloaded file can be used without sending any request
+        '''
+        entry = self._entry_(url, path)
+        if entry is None:
+            return False
+        if entry[3]:
+            return True
+        return self.maxage > 0 and time() - entry[2] < self.maxage
+
+    def _condheaders_(self, url, path):
+        '''
+        headers for a conditional GET request, empty if the url has not been downloaded to `path`
+        '''
+        entry = self._entry_(url, path)
+        headers = {}
+        if entry is None:
+            return headers
+        if entry[0]:
+            headers['If-None-Match'] = entry[0]
+        if entry[1]:
+            headers['If-Modified-Since'] = entry[1]
+        return headers
+
+    def _hit_(self, url, path):
+        '''
+        record a cache hit, the size of the file on the disk is counted as saved;
+        the url is recorded for `path` if it was not (e.g. the file was linked from a BLOBCACHE)
+        '''
+        with self.lock, self.conn:
+            self.stats['hit'] += 1
+            self.stats['bytes_saved'] += os.path.getsize(path)
+            self.conn.execute(
+                'INSERT INTO urls (url, path, fetched) VALUES (?, ?, ?) '
+                'ON CONFLICT(url) DO UPDATE SET path = excluded.path, fetched = excluded.fetched',
+                (url, path, time()),
+            )
+
+    def _store_(self, url, path, headers, size):
+        '''record a (new) downloaded file'''
+        with self.lock, self.conn:
+            self.stats['miss'] += 1
+            self.stats['bytes_downloaded'] += size
+            self.conn.execute(
+                'INSERT INTO urls (url, path, etag, lastmodified, fetched) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(url) DO UPDATE SET path = excluded.path, etag = excluded.etag, '
+                'lastmodified = excluded.lastmodified, fetched = excluded.fetched',
+                (url, path, headers.get('ETag'), headers.get('Last-Modified'), time()),
+            )
+
+    def _report_(self):
+        '''
+        log and return the statistics of this run
+        '''
+        with self.lock:
+            stats = dict(self.stats)
+        self.logger.info('cache hit: {}, miss: {}, {:.1f} MB saved, {:.1f} MB downloaded...'.format(
+            stats['hit'], stats['miss'], stats['bytes_saved'] / 1e6, stats['bytes_downloaded'] / 1e6
+        ))
+        return stats
+
+    def _close_(self):
+        '''close the cache'''
+        with self.lock:
+            self.conn.close()
+
+SUBMISSION_URL = 'https://data.sec.gov/submissions'
+
+THROTTLE_STATUS = (403, 429, 503)
+THROTTLE_MARK = b'Your Request Originates from an Undeclared Automated Tool'
+
+def _check_throttle_(r, head):
+    '''
+    Check if the response is the edgar throttling page from its status code, headers and the first bytes of the body
+
+    Params:
+    ----------
+    r: requests.Response
+    head: bytes
+        the first bytes of the (decoded) body
+    '''
+    if r.status_code in THROTTLE_STATUS or 'Retry-After' in r.headers:
+        return True
+    return THROTTLE_MARK in head
+
+def _check_complete_(r):
+    '''
+    Check if the whole body has been received, compare the bytes read from the wire with `Content-Length`
+    '''
+    contentlength = r.headers.get('Content-Length')
+    if contentlength is None:
+        return True
+    return r.raw.tell() == int(contentlength)
+
+def _cached_(url, path, cache=None, blobcache=None, compress=None):
+    '''
+    Check if `path` can be used (or linked from the shared cache) without sending any request,
+    with both caches `cache` decides, so urls that may change are still requested (conditionally)
+    '''
+    if cache is not None:
+        if cache._fresh_(url, path):
+            cache._hit_(url, path)
+            return True
+        return False
+    return blobcache is not None and blobcache._fresh_(url, path, compress)
+
+def _download_url_(url, path, overwrite=True, session=None, chunksize=1<<16, sniffsize=1<<13, cache=None, compress=None, blobcache=None):
     '''
     Download file from a given `url` and save it to the `path` in your computer
+    the body is streamed to a temporary file chunk by chunk and renamed to `path` once it is complete,
+    a throttled or partial response never reaches `path`
 
     Params:
     ----------
     url: str
     path: str
+    session: requests.Session or None
+        session for reusing connections, the module shared session is used if not given
+    chunksize: int
+        number of bytes written to the disk each time
+    sniffsize: int
+        number of bytes at the start of the body checked for the throttling page
+    cache: HTTPCACHE or None
+        if given, fresh files are not requested again and other cached files are requested conditionally
+    compress: str or None
+        `gzip` or `zstd` for streaming the body into a compressed file at `path` (same file name),
+        read it back with `utils._openfile_`, which detects the codec
+    blobcache: BLOBCACHE or None
+        shared content-addressed cache, `path` becomes a hard link to the cached file and requests are
+        conditional on its `ETag`/`Last-Modified`; if `cache` is given too, `cache` decides which urls are
+        not requested at all (immutable urls, `maxage`), otherwise the `maxage` of `blobcache` does
+
+    Returns:
+    ----------
+    True if the file was downloaded, False if edgar throttled the request or the body was incomplete
     '''
     logger = logging.getLogger('edgar.download')
 
-    headers = {"User-Agent": "Andy Wang (ztwang201605@gmail.com)"}
+    if session is None:
+        session = _getsession_()
+
+    if _cached_(url, path, cache, blobcache, compress):
+        logger.debug(f'using cached file {path} without requesting...')
+        return True
+    headers = {}
+    if blobcache is not None:
+        headers = blobcache._condheaders_(url, compress)
+    elif cache is not None:
+        headers = cache._condheaders_(url, path)
 
     ### check if the path has already been existed
     if os.path.exists(path):
@@ -31,28 +275,107 @@ def _download_url_(url, path, overwrite=True):
             logger.warning('overwriting the file...')
 
     logger.info(f'downloading the file from - {url}')
-    r = requests.get(url, headers=headers)
-    with open(path, 'wb') as fp:
-        fp.write(r.content)
+    tmppath = None
+    try:
+        with session.get(url, stream=True, headers=headers) as r:
+            if r.status_code == 304:
+                logger.info(f'file {path} not modified...')
+                if blobcache is not None:
+                    if blobcache._hit_(url, path, compress):
+                        if cache is not None:
+                            cache._hit_(url, path)
+                        return True
+                    ### the cached content is gone, ask for the whole file again (no conditional headers now)
+                    r.close()
+                    return _download_url_(url, path, overwrite, session, chunksize, sniffsize, cache, compress, blobcache)
+                cache._hit_(url, path)
+                return True
+            chunks = r.iter_content(chunk_size=chunksize)
+            ### read the first bytes for checking throttling before touching the disk
+            head = b''
+            for chunk in chunks:
+                head += chunk
+                if len(head) >= sniffsize:
+                    break
+            if _check_throttle_(r, head):
+                logger.info(f'The downloading was throttled (status {r.status_code})...')
+                return False
+            r.raise_for_status()
+
+            pathdir = os.path.dirname(path) or '.'
+            fd, tmppath = tempfile.mkstemp(dir=pathdir, prefix=f'.{os.path.basename(path)}.', suffix='.part')
+            ### the decoded body is hashed as it is written, for the shared cache
+            digest = hashlib.sha256(head)
+            with os.fdopen(fd, 'wb') as rawfp, _compresswriter_(rawfp, compress) as fp:
+                fp.write(head)
+                for chunk in chunks:
+                    fp.write(chunk)
+                    digest.update(chunk)
+            if not _check_complete_(r):
+                logger.info('The downloading was incomplete...')
+                return False
+        if blobcache is not None:
+            linked = blobcache._put_(url, tmppath, path, r.headers, r.raw.tell(), digest.hexdigest(), compress)
+            tmppath = None
+            if not linked:
+                return False
+        else:
+            os.replace(tmppath, path)
+            tmppath = None
+        if cache is not None:
+            cache._store_(url, path, r.headers, r.raw.tell())
+    except requests.exceptions.ChunkedEncodingError:
+        logger.info('The connection was broken during downloading...')
+        return False
+    finally:
+        if tmppath is not None:
+            os.remove(tmppath)
     logger.info('file downloaded successfully...')
     return True
 
-def _check_fail_(path, drop=True):
+class RATELIMITER:
     '''
-    Check if the url was failed to access due to edgar limit, delete the file if `drop` is True
-    '''
-    logger = logging.getLogger('edgar.download')
-
-    with open(path) as fp:
-        content = fp.read()
+    token bucket shared by all download workers, so that the global request rate stays under `rate`
 
-    fail = 'Your Request Originates from an Undeclared Automated Tool' in content
-    if fail:
-        logger.info('The downloading was failed...')
-        if drop:
-            logger.info(f'removing the failed file - {path}')
-            os.remove(path)
-    return fail
+    Initialize the object
+    Params:
+    ----------
+    rate: float
+        maximum number of requests per second (SEC allows 10 requests per second)
+    burst: int
+        maximum number of tokens kept in the bucket, i.e. requests allowed to be sent at once
+    '''
+    def __init__(
+        self,
+        rate=8,
+        burst=1,
+        ):
+        if rate <= 0:
+            raise ValueError(f'rate should be positive, but {rate} given... Aborted...')
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.lasttime = monotonic()
+        self.lock = Lock()
+
+    def _refill_(self):
+        '''add tokens accumulated since the last refill'''
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.lasttime) * self.rate)
+        self.lasttime = now
+
+    def _acquire_(self):
+        '''
+        block until a token is available and consume it
+        '''
+        while True:
+            with self.lock:
+                self._refill_()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
 
 class DOWNLOADER:
     '''
@@ -70,7 +393,19 @@ class DOWNLOADER:
     overwrite: bool
         whether to overwrite the file or not
     drop: bool
-        whether to delete the file if it was failed    
+        kept for compatibility, failed downloads are never written to `path`
+    limiter: RATELIMITER or None
+        rate limiter shared with other downloaders, every request waits for a token if given
+    session: requests.Session or None
+        session for reusing connections, the module shared session is used if not given
+    chunksize: int
+        number of bytes written to the disk each time
+    cache: HTTPCACHE or None
+        cache of `ETag`/`Last-Modified` for conditional requests
+    compress: str or None
+        `gzip` or `zstd` for saving the file compressed, see `_download_url_`
+    blobcache: BLOBCACHE or None
+        shared content-addressed cache, see `_download_url_`
     '''
     def __init__(
         self,
@@ -80,12 +415,24 @@ class DOWNLOADER:
         overwrite=True,
         drop=True,
         sleep=2,
+        limiter=None,
+        session=None,
+        chunksize=1<<16,
+        cache=None,
+        compress=None,
+        blobcache=None,
         ):
         self.logger = logging.getLogger('edgar.download')
         self.url = url; self.path = path
         self.maxiter = maxiter
         self.overwrite = overwrite; self.drop = drop
         self.sleep = sleep
+        self.limiter = limiter
+        self.session = session
+        self.chunksize = chunksize
+        self.cache = cache
+        self.compress = compress
+        self.blobcache = blobcache
 
         ### initial check
         self._checkdir_()
@@ -98,10 +445,23 @@ class DOWNLOADER:
             self.logger.error(f'{self.path} is not a correct file path...')
             raise ValueError(f'{self.path} is not a correct file path... Aborted...')
 
-        pathdir = '/'.join(self.path.split('/')[:-1])
-        if not os.path.exists(pathdir):
+        pathdir = os.path.dirname(self.path)
+        ### bare file names are saved to the working directory
+        if pathdir and not os.path.exists(pathdir):
             self.logger.info(f'making new directory - {pathdir}...')
-            os.makedirs(pathdir)
+            os.makedirs(pathdir, exist_ok=True)
+
+    def _download_(self):
+        '''download the file once, waiting for the shared rate limiter if there is one'''
+        if _cached_(self.url, self.path, self.cache, self.blobcache, self.compress):
+            return True
+        if self.limiter is not None:
+            self.limiter._acquire_()
+        return _download_url_(
+            self.url, self.path, overwrite=self.overwrite,
+            session=self.session, chunksize=self.chunksize, cache=self.cache, compress=self.compress,
+            blobcache=self.blobcache,
+        )
 
     def _iterdownload_(self):
         '''
@@ -109,42 +469,217 @@ class DOWNLOADER:
         '''
         download_attempt = 0
         self.logger.info(f'downloading iteration - {download_attempt}')
-        _download_url_(self.url, self.path, overwrite=self.overwrite)
         
-        
-        while _check_fail_(self.path, drop=self.drop):
-            sleep(random.uniform(self.sleep, self.sleep + 2))
-
+        while not self._download_():
             download_attempt += 1
-            self.logger.info(f'downloading iteration - {download_attempt}')
-            _download_url_(self.url, self.path, overwrite=self.overwrite)
-
             if self.maxiter > 0 and download_attempt > self.maxiter:
                 self.logger.info(f'have reached maximum attempts ({self.maxiter})... Aborted...')
                 return -1
+
+            sleep(random.uniform(self.sleep, self.sleep + 2))
+            self.logger.info(f'downloading iteration - {download_attempt}')
         return 1
 
+class BATCHDOWNLOADER:
+    '''
+    object for downloading a batch of ``edgar'' files concurrently with a thread pool
+
+    Initialize the object
+    Params:
+    ----------
+    jobs: list
+        list of (url, path) tuples
+    maxworkers: int
+        number of downloading threads
+    rate: float
+        global request rate (per second) shared by all threads
+    limiter: RATELIMITER or None
+        an existing rate limiter, `rate` is ignored if given
+    session: requests.Session or None
+        session shared by all threads, a new one keeping `maxconnections` connections per host is made if not given
+    maxconnections: int
+        maximum number of connections for each host, `maxworkers` by default
+    maxiter, overwrite, drop, sleep, chunksize, cache, compress, blobcache:
+        passed to DOWNLOADER for every job
+    callback: callable or None
+        called as callback(jobidx, status) once a job is finished
+    '''
+    def __init__(
+        self,
+        jobs,
+        maxworkers=4,
+        rate=8,
+        limiter=None,
+        session=None,
+        maxconnections=None,
+        maxiter=5,
+        overwrite=True,
+        drop=True,
+        sleep=2,
+        chunksize=1<<16,
+        cache=None,
+        compress=None,
+        blobcache=None,
+        callback=None,
+        ):
+        self.logger = logging.getLogger('edgar.download')
+        self.jobs = list(jobs)
+        self.maxworkers = maxworkers
+        self.limiter = limiter if limiter is not None else RATELIMITER(rate=rate)
+        if session is None:
+            session = _makesession_(maxconnections=maxconnections or maxworkers)
+        self.session = session
+        self.maxiter = maxiter
+        self.overwrite = overwrite; self.drop = drop
+        self.sleep = sleep
+        self.chunksize = chunksize
+        self.cache = cache
+        self.compress = compress
+        self.blobcache = blobcache
+        self.callback = callback
+
+    def _downloadjob_(self, url, path):
+        '''
+        download a single job, return 1 for success, -1 for reaching maxiter, -2 for errors
+        '''
+        try:
+            downloader = DOWNLOADER(
+                url = url,
+                path = path,
+                maxiter = self.maxiter,
+                overwrite = self.overwrite,
+                drop = self.drop,
+                sleep = self.sleep,
+                limiter = self.limiter,
+                session = self.session,
+                chunksize = self.chunksize,
+                cache = self.cache,
+                compress = self.compress,
+                blobcache = self.blobcache,
+            )
+            return downloader._iterdownload_()
+        except Exception as excpt:
+            self.logger.error(f'error in downloading {url} - {excpt}')
+            return -2
+
+    def _rundownload_(self):
+        '''
+        download all jobs, return a list of status in the same order as `jobs`
+        '''
+        self.logger.info('downloading {} files with {} workers at most {} requests/s...'.format(
+            len(self.jobs), self.maxworkers, self.limiter.rate
+        ))
+        self.status = [None] * len(self.jobs)
+        with ThreadPoolExecutor(max_workers=self.maxworkers) as executor:
+            futures = {
+                executor.submit(self._downloadjob_, url, path): jobidx
+                for jobidx, (url, path) in enumerate(self.jobs)
+            }
+            for future in as_completed(futures):
+                jobidx = futures[future]
+                self.status[jobidx] = future.result()
+                if self.callback is not None:
+                    self.callback(jobidx, self.status[jobidx])
+        self.logger.info('{} out of {} files downloaded successfully...'.format(
+            self.status.count(1), len(self.jobs)
+        ))
+        return self.status
+
+def _parse_recent_json_(recent_sub):
+    '''
+    parse a loaded recent submission json (`CIK##########.json`)
+
+    Returns:
+    ----------
+    recent filings dataframe, list of other submission files (`filings.files`)
+    '''
+    return pd.DataFrame(recent_sub['filings']['recent']), recent_sub['filings']['files']
+
+def _parse_history_json_(hist_sub):
+    '''
+    parse a loaded historical submission json (`CIK##########-submissions-###.json`) into a dataframe
+    '''
+    return pd.DataFrame(hist_sub)
+
 class COMPANYFILINGJSON:
     '''
     object for manipulating json files for a given company (i.e.: CIK)
+
+    Params:
+    ----------
+    cik: int or str
+        company CIK
+    jsonpath: str
+        directory for saving json files
+    limiter: RATELIMITER or None
+        rate limiter shared with other downloads, a new one is made if not given
+    maxworkers: int
+        number of threads for downloading historical submission files
+    session: requests.Session or None
+        session for reusing connections, the module shared session is used if not given
+    cache: HTTPCACHE or None
+        cache for conditional requests, `$jsonpath/httpcache.sqlite` is used if not given.
+        all historical submission files but the latest one are treated as immutable
+    incremental: bool
+        if True, load the saved combined dataframe and only add filings that are not in it yet,
+        historical submission files are only downloaded if they have not been seen before
+    storedir: str or None
+        if given, the typed filings are also saved to the parquet `FILINGSTORE` in this directory (requires pyarrow)
+    index: FILINGINDEX or None
+        if given, filings of the company are updated in this cross-company index
+    compress: str or None
+        `gzip` or `zstd` for saving downloaded json files compressed, saved files are read back whether compressed or not
+    blobcache: BLOBCACHE or None
+        shared content-addressed cache for the json files, `cache` still decides which files are requested again
+        (the recent submission file always is)
+    lazy: bool
+        if True, nothing is downloaded or parsed when the object is made,
+        filings are read page by page with `_iterpages_` or `_latest_filing_`
     '''
     def __init__(
         self,
         cik,
         jsonpath,
+        limiter=None,
+        maxworkers=4,
+        session=None,
+        cache=None,
+        incremental=False,
+        storedir=None,
+        index=None,
+        compress=None,
+        blobcache=None,
+        lazy=False,
         ):
         self.logger = logging.getLogger('edgar.download')
         self.cik = self._formatcik_(cik)
         self.jsonpath = jsonpath
+        self.limiter = limiter if limiter is not None else RATELIMITER()
+        self.maxworkers = maxworkers
+        self.session = session if session is not None else _getsession_()
         self.logger.info(f'working on company CIK{self.cik}... saving data to {self.jsonpath}...')
         ### make directory for jsonpath
         if not os.path.exists(self.jsonpath):
             os.makedirs(self.jsonpath)
+        self.cache = cache if cache is not None else HTTPCACHE(f'{self.jsonpath}/httpcache.sqlite')
         ### several lists initialization
         self.jsondflst = []
         self.jsonsublst = []
+        self.jsonsubfiles = []
+        self.exchange = None
+        self.storedir = storedir
+        self.index = index
+        self.compress = compress
+        self.blobcache = blobcache
+        self.storefname = f'{self.jsonpath}/CIK{self.cik}.submission.all.pickle'
+        self.pagesfname = f'{self.jsonpath}/CIK{self.cik}.submission.pages.json'
         ### running downloading and parsing
-        self._download_parse_()
+        if lazy:
+            return
+        if incremental:
+            self._update_parse_()
+        else:
+            self._download_parse_()
 
     def _formatcik_(self, cik):
         '''formatting the cik to the length of 10'''
@@ -154,15 +689,17 @@ class COMPANYFILINGJSON:
         recentfile = f'{self.jsonpath}/CIK{self.cik}.json'
         self.logger.info(f'loading recent json file from {recentfile}...')
 
-        with open(recentfile) as fp:
+        with _openfile_(recentfile, 'rb') as fp:
             recent_sub = json.load(fp)
 
         ### extracting files from recent submission
         self.logger.info('adding recent filings dataframe...')
-        self.jsondflst.append(pd.DataFrame(recent_sub['filings']['recent']))
+        recentdf, self.jsonsubfiles = _parse_recent_json_(recent_sub)
+        self.exchange = (recent_sub.get('exchanges') or [None])[0]
+        self.jsondflst.append(recentdf)
 
         self.logger.info(f'finding other json files for CIK{self.cik}...')
-        for jsonsub in recent_sub['filings']['files']:
+        for jsonsub in self.jsonsubfiles:
             self.jsonsublst.append(jsonsub['name'])
         self.logger.info('{} other json submission files found...'.format(len(self.jsonsublst)))
 
@@ -170,39 +707,78 @@ class COMPANYFILINGJSON:
         '''parse historical json submission files'''
 
         self.logger.info(f'loading submission files from {fname}')
-        with open(fname) as fp:
+        with _openfile_(fname, 'rb') as fp:
             hist_sub = json.load(fp)
 
-        self.jsondflst.append(pd.DataFrame(hist_sub))
+        self.jsondflst.append(_parse_history_json_(hist_sub))
 
-    def _download_parse_(self):
-        '''download files and parsing them into a dataframe'''
-        self.logger.info('starting downloading all relavent submission json files and parsing to dataframe...')
-        submission_dir_url = 'https://data.sec.gov/submissions'
-
-        ### download recent json
+    def _download_recent_(self):
+        '''download the recent submission json file'''
         self.logger.info('downloading recent submission file...')
         downloader = DOWNLOADER(
-            url = f'{submission_dir_url}/CIK{self.cik}.json',
+            url = f'{SUBMISSION_URL}/CIK{self.cik}.json',
             path = f'{self.jsonpath}/CIK{self.cik}.json',
             maxiter = 5,
             sleep = 2,
+            limiter = self.limiter,
+            session = self.session,
+            cache = self.cache,
+            compress = self.compress,
+            blobcache = self.blobcache,
         )
         downloader._iterdownload_()
+
+    def _download_history_(self, histsubs):
+        '''download historical submission json files in `histsubs`'''
+        ### older pages never change once a newer one exists
+        self.logger.info('downloading {} historical submission files...'.format(len(histsubs)))
+        if len(self.jsonsubfiles) > 1:
+            latestsub = max(self.jsonsubfiles, key=lambda jsonsub: jsonsub.get('filingTo', ''))['name']
+            for histsub in histsubs:
+                if histsub != latestsub:
+                    self.cache._markimmutable_(f'{SUBMISSION_URL}/{histsub}')
+        batchdownloader = BATCHDOWNLOADER(
+            jobs = [
+                (f'{SUBMISSION_URL}/{histsub}', f'{self.jsonpath}/{histsub}')
+                for histsub in histsubs
+            ],
+            maxworkers = self.maxworkers,
+            limiter = self.limiter,
+            session = self.session,
+            maxiter = 5,
+            sleep = 2,
+            cache = self.cache,
+            compress = self.compress,
+            blobcache = self.blobcache,
+        )
+        batchdownloader._rundownload_()
+        self.cache._report_()
+
+    def _save_store_(self):
+        '''save the combined dataframe and the historical submission files it contains'''
+        self.logger.info('saving combined dataframe...')
+        self.jsondataframe.to_pickle(self.storefname)
+        with open(self.pagesfname, 'w') as fp:
+            json.dump(self.jsonsublst, fp)
+        if self.storedir is not None:
+            from filingstore import FILINGSTORE
+            filingstore = FILINGSTORE(self.storedir)
+            filingstore._write_(self.jsondataframe, self.cik, self.exchange)
+            filingstore._close_()
+        if self.index is not None:
+            self.index._update_company_(self.cik, self.jsondataframe)
+
+    def _download_parse_(self):
+        '''download files and parsing them into a dataframe'''
+        self.logger.info('starting downloading all relavent submission json files and parsing to dataframe...')
+
+        ### download recent json
+        self._download_recent_()
         ### analyzing recent json
         self._parse_recent_()
 
         ### download historical json
-        self.logger.info('downloading historical submission files...')
-        for histsub in self.jsonsublst:
-            sleep(2) # rest for a few seconds
-            downloader = DOWNLOADER(
-                url = f'{submission_dir_url}/{histsub}',
-                path = f'{self.jsonpath}/{histsub}',
-                maxiter = 5,
-                sleep = 2,
-            )
-            downloader._iterdownload_()
+        self._download_history_(self.jsonsublst)
         ### analyzing historical json
         for histsub in self.jsonsublst:
             self._parse_history_(f'{self.jsonpath}/{histsub}')
@@ -210,8 +786,126 @@ class COMPANYFILINGJSON:
         ### concatenating dataframes
         self.logger.info('concatenating dataframes...')
         self.jsondataframe = pd.concat(self.jsondflst).reset_index(drop=True)
-        self.logger.info('saving combined dataframe...')
-        self.jsondataframe.to_pickle(f'{self.jsonpath}/CIK{self.cik}.submission.all.pickle')
+        ### the pages are not kept along with the combined copy
+        self.jsondflst = []
+        self._save_store_()
+
+    def _update_parse_(self):
+        '''
+        add new filings to the saved combined dataframe, 
+        only new rows in the recent submission file and historical files not seen before are parsed
+        '''
+        if not os.path.exists(self.storefname) or not os.path.exists(self.pagesfname):
+            self.logger.info('no saved combined dataframe found... building from scratch...')
+            return self._download_parse_()
+
+        self.logger.info(f'loading saved combined dataframe from {self.storefname}...')
+        storedf = pd.read_pickle(self.storefname)
+        with open(self.pagesfname) as fp:
+            seensubs = set(json.load(fp))
+        knownacc = set(storedf['accessionNumber'])
+
+        ### recent filings are sorted from the latest, new ones are above the last known accession number
+        self._download_recent_()
+        self._parse_recent_()
+        recentdf = self.jsondflst[0]
+        lastidx = None
+        if len(storedf) > 0:
+            lastidx = (recentdf['accessionNumber'] == storedf['accessionNumber'].iloc[0]).to_numpy().nonzero()[0]
+        if lastidx is not None and len(lastidx) > 0:
+            newdflst = [recentdf.iloc[:lastidx[0]]]
+        else:
+            newdflst = [recentdf[~recentdf['accessionNumber'].isin(knownacc)]]
+
+        ### historical files listed for the first time
+        newsubs = [histsub for histsub in self.jsonsublst if histsub not in seensubs]
+        if newsubs:
+            self._download_history_(newsubs)
+        self.jsondflst = self.jsondflst[:1]
+        for histsub in newsubs:
+            self._parse_history_(f'{self.jsonpath}/{histsub}')
+        for histdf in self.jsondflst[1:]:
+            newdflst.append(histdf[~histdf['accessionNumber'].isin(knownacc)])
+
+        newrows = sum(len(newdf) for newdf in newdflst)
+        self.logger.info(f'{newrows} new filings found for CIK{self.cik}...')
+        if newrows == 0 and not newsubs:
+            self.jsondataframe = storedf
+            return
+        self.jsondataframe = pd.concat(
+            newdflst[:1] + [storedf] + newdflst[1:]
+        ).reset_index(drop=True)
+        self._save_store_()
+
+    def _download_page_(self, histsub):
+        '''download one historical submission json file'''
+        downloader = DOWNLOADER(
+            url = f'{SUBMISSION_URL}/{histsub}',
+            path = f'{self.jsonpath}/{histsub}',
+            maxiter = 5,
+            sleep = 2,
+            limiter = self.limiter,
+            session = self.session,
+            cache = self.cache,
+            compress = self.compress,
+            blobcache = self.blobcache,
+        )
+        downloader._iterdownload_()
+
+    def _filterforms_(self, filingdf, forms):
+        '''filings of `forms` only, all filings if `forms` is None'''
+        if forms is None:
+            return filingdf
+        return filingdf[filingdf['form'].isin(forms)].reset_index(drop=True)
+
+    def _iterpages_(self, forms=None):
+        '''
+        yield filings one submission file (page) at a time, the recent submission file first
+        and then the historical files from the latest; a page is only downloaded and parsed
+        when the previous one has been consumed, and nothing is kept between pages
+
+        Params:
+        ----------
+        forms: str, list or None
+            only yield filings of these forms (e.g. `10-K`), None for all filings
+
+        Yields:
+        ----------
+        pd.DataFrame - filings in one page, in the same columns as `jsondataframe`
+        '''
+        forms = [forms] if isinstance(forms, str) else forms
+        self._download_recent_()
+        recentfile = f'{self.jsonpath}/CIK{self.cik}.json'
+        with _openfile_(recentfile, 'rb') as fp:
+            recent_sub = json.load(fp)
+        recentdf, self.jsonsubfiles = _parse_recent_json_(recent_sub)
+        self.exchange = (recent_sub.get('exchanges') or [None])[0]
+        del recent_sub
+        self.logger.info('{} other json submission files found...'.format(len(self.jsonsubfiles)))
+        yield self._filterforms_(recentdf, forms)
+        del recentdf
+
+        ### older pages never change once a newer one exists
+        histsubs = sorted(self.jsonsubfiles, key=lambda jsonsub: jsonsub.get('filingTo', ''), reverse=True)
+        for pageidx, jsonsub in enumerate(histsubs):
+            if pageidx > 0:
+                self.cache._markimmutable_(f'{SUBMISSION_URL}/{jsonsub["name"]}')
+            self._download_page_(jsonsub['name'])
+            self.logger.info(f'loading submission files from {jsonsub["name"]}')
+            with _openfile_(f'{self.jsonpath}/{jsonsub["name"]}', 'rb') as fp:
+                histdf = _parse_history_json_(json.load(fp))
+            yield self._filterforms_(histdf, forms)
+
+    def _latest_filing_(self, form='10-K'):
+        '''
+        the latest filing of `form` as a pd.Series, None if the company never filed one;
+        pages are only read until the first one containing the form
+        '''
+        for filingdf in self._iterpages_(forms=form):
+            if len(filingdf) > 0:
+                ### in case a page is not sorted from the latest
+                return filingdf.sort_values('filingDate', ascending=False, kind='stable').iloc[0]
+        return None
 
 if __name__ == '__main__':
     _setlogger_(module='edgar', logfname='test.log')
@@ -1,10 +1,11 @@
-import DOWNLOAD
+from download import BATCHDOWNLOADER
+from journal import JOBJOURNAL
+from blobcache import BLOBCACHE
 import pandas as pd
-import pickle
 
 import argparse
 
-def _download_dataframe(dfpath, filetype, urlcol, fnamecol, include_basedir=False, basedir=''):
+def _download_dataframe(dfpath, filetype, urlcol, fnamecol, include_basedir=False, basedir='', maxworkers=4, rate=8, compress=None, cachedir=None, cachesize=50<<30):
     '''
     Download Files from dataframe, which contains url and file name
     
@@ -22,6 +23,16 @@ def _download_dataframe(dfpath, filetype, urlcol, fnamecol, include_basedir=Fals
         If True, basedir is included in file name
     basedir: str, an empty string by default
         The directory for downloading all files
+    maxworkers: int, 4 by default
+        Number of threads downloading files at the same time
+    rate: float, 8 by default
+        Maximum number of requests per second shared by all threads
+    compress: str or None, None by default
+        `gzip` or `zstd` for saving files compressed (same file names), read them with `utils._openfile_`
+    cachedir: str or None, None by default
+        Directory of the shared download cache (BLOBCACHE), files are hard links into it if given
+    cachesize: int, 50GB by default
+        Disk budget of the shared download cache
         
     Returns:
     ------------
@@ -36,33 +47,54 @@ def _download_dataframe(dfpath, filetype, urlcol, fnamecol, include_basedir=Fals
         
     if basedir == '':
         statusdffname = './downloaddf_status.pickle'
-        statuslstfname = './download_status.pickle'
+        journalfname = './download_journal.sqlite'
     else:
         statusdffname = f'{basedir}/downloaddf_status.pickle'
-        statuslstfname = f'{basedir}/download_status.pickle'
+        journalfname = f'{basedir}/download_journal.sqlite'
+    journal = JOBJOURNAL(journalfname)
+    blobcache = None if cachedir is None else BLOBCACHE(cachedir, maxbytes=cachesize)
         
-    download_status = []
-    download_count = 1; rowcount = len(df)
+    jobs = []
     for i, row in df.iterrows():
-        ### print info
-        print(f'{download_count}/{rowcount} - Start Downloading'.center(80, '+'))
         download_url = row[urlcol]
         download_fname = row[fnamecol]
-        print(f'[info] URL:{download_url}')
-        print(f'[info] PATH:{download_fname}')
         if not include_basedir:
             download_fname = f'{basedir}/{download_fname}'
-            
-        download_status.append(DOWNLOAD._download_edgar(download_url, download_fname))
+        jobs.append((download_url, download_fname))
+
+    ### skip jobs finished in previous runs, the file path is the job id
+    remaining = [job for job in jobs if not journal._done_(job[1])]
+    print(f'[info] {len(jobs) - len(remaining)} files downloaded in previous runs, {len(remaining)} to go')
+
+    download_count = 1; rowcount = len(remaining)
+    def _report_status(jobidx, status):
+        nonlocal download_count
+        download_url, download_fname = remaining[jobidx]
+        journal._record_(download_fname, status, info=download_url)
+        print(f'{download_count}/{rowcount} - Finished Downloading'.center(80, '+'))
+        print(f'[info] URL:{download_url}')
+        print(f'[info] PATH:{download_fname}')
         download_count += 1
+
+        print(f'Status - {status}'.center(80, '+'))
+
+    downloader = BATCHDOWNLOADER(
+        remaining,
+        maxworkers=maxworkers,
+        rate=rate,
+        maxiter=-1,
+        compress=compress,
+        blobcache=blobcache,
+        callback=_report_status,
+    )
+    downloader._rundownload_()
         
-        with open(statuslstfname, 'wb') as fp:
-            pickle.dump(download_status, fp)
-            
-        print(f'Finished Downloading! Status - {download_status[-1]}'.center(80, '+'))
-        
-    df['download_status'] = download_status
+    df['download_status'] = journal._status_([job[1] for job in jobs])
     df.to_pickle(statusdffname)
+    journal._close_()
+    if blobcache is not None:
+        blobcache._report_()
+        blobcache._close_()
        
         
 if __name__ == '__main__':
@@ -73,7 +105,13 @@ if __name__ == '__main__':
     parser.add_argument('--file', type=str, required=True, help='Column name for filenames')
     parser.add_argument('--include_basedir', type=int, default=0, choices={0, 1}, help='1 If your filenames include basedir, 0 if not')
     parser.add_argument('--base', type=str, default='', help='The base directory for downloading files')
+    parser.add_argument('--workers', type=int, default=4, help='Number of threads downloading files at the same time')
+    parser.add_argument('--rate', type=float, default=8, help='Maximum number of requests per second (SEC allows 10)')
+    parser.add_argument('--compress', type=str, default=None, choices={'gzip', 'zstd'}, help='Save files compressed (optional)')
+    parser.add_argument('--cache', type=str, default=None, help='Directory of the shared download cache (optional)')
+    parser.add_argument('--cachesize', type=float, default=50, help='Disk budget of the shared download cache in GB')
     
     args = parser.parse_args()
     
-    _download_dataframe(args.dfpath, args.t, args.url, args.file, bool(args.include_basedir), args.base)
\ No newline at end of file
+    _download_dataframe(args.dfpath, args.t, args.url, args.file, bool(args.include_basedir), args.base, args.workers, args.rate, args.compress,
+        args.cache, int(args.cachesize * 1024**3))
\ No newline at end of file
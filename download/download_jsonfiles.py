@@ -1,34 +1,33 @@
 # Download Submission Json Files for all company
 
+from download import _download_url_
+from blobcache import BLOBCACHE
+from utils import _openfile_
+from journal import JOBJOURNAL
 from time import sleep
 from numpy import random
 import pandas as pd
-import requests
 import json
 import os
 
-def _download_file(url, path):
-    r = requests.get(url)
-    with open(path, 'wb') as fp:
-        fp.write(r.content)
+def _download_file(url, path, chunksize=1<<16, compress=None, blobcache=None):
+    '''
+    Stream the file to `path` with the shared keep-alive session, compressed with `compress` (`gzip`/`zstd`) if given,
+    through the shared download cache `blobcache` (BLOBCACHE) if given
 
-def _check_fail(reportpath):    
-    with open(reportpath) as fp:
-        content = fp.read()
-        
-    return 'Your Request Originates from an Undeclared Automated Tool' in content
+    return False if edgar throttled the request, the throttling page is never saved to `path`
+    '''
+    return _download_url_(url, path, chunksize=chunksize, compress=compress, blobcache=blobcache)
 
 
-def _download_edgar(url, path, maxiter=-1, verbose=True):
+def _download_edgar(url, path, maxiter=-1, verbose=True, compress=None, blobcache=None):
     '''
     Download files from edgar, maxiter is the maximum attempts, -1 means try until download successfully
     '''
     try:
         attemptcount = 0
-        _download_file(url, path)
-        while _check_fail(path):
+        while not _download_file(url, path, compress=compress, blobcache=blobcache):
             sleep(random.uniform(1,2))
-            _download_file(url, path)
             attemptcount += 1
             print(f'--Download Edgar Failed - Attempts ({attemptcount})--')
             
@@ -46,27 +45,17 @@ if __name__ == "__main__":
     
     jsonsavedir = '../../data/edgar/json/download/'
     submissiondir = 'https://data.sec.gov/submissions/'
-    statusjsonfname = '../../data/edgar/json/status_test.json'
-    jsondict = {'CIK':[],
-                'files':[],
-                'status':[]
-               }
+    journalfname = '../../data/edgar/json/status_journal.sqlite'
+    ### one record per CIK, CIKs finished in previous runs are skipped
+    journal = JOBJOURNAL(journalfname)
+    ### download cache shared with other jobs, submission files are requested again after a day
+    blobcache = BLOBCACHE('../../data/edgar/blobcache', maxage=24*3600)
 
-    count = len(jsondict['CIK'])+1
+    ciks = journal._remaining_([f'{cik:0>10d}' for cik in ciks])
     cikcount = len(ciks)
-    
-    ###read old json dict
-    if os.path.exists(statusjsonfname):
-        with open(statusjsonfname) as fp:
-            jsondict = json.load(fp)
+    count = 1
     
     for cik in ciks:
-        # format cik
-        cik = f'{cik:0>10d}'
-        
-        ### check dict
-        if cik in jsondict['CIK']:
-            continue
 
         print(f'+++++{count}/{cikcount} - Start Downloading Submission Json Files For {cik}+++++')
 
@@ -80,16 +69,16 @@ if __name__ == "__main__":
         recentjsonfpath = f'{jsonsavedir}/{recentjsonfname}'
         jsonfiles.append(recentjsonfname)
 
-        download_status.append(_download_edgar(recentjson_url, recentjsonfpath))
+        download_status.append(_download_edgar(recentjson_url, recentjsonfpath, blobcache=blobcache))
 
         sleep(1)
         ### Open recent file
-        if os.path.exists(recentjsonfpath):
-            if not _check_fail(recentjsonfpath):
+        if download_status[-1] == 1:
+            if os.path.exists(recentjsonfpath):
                 
                 openrecent = False
                 try:
-                    with open(recentjsonfpath) as fp:
+                    with _openfile_(recentjsonfpath, 'rb') as fp:
                         recentjson = json.load(fp)
                     openrecent = True
                 except:
@@ -103,17 +92,11 @@ if __name__ == "__main__":
                         jsonfpath = f'{jsonsavedir}/{jsonfname}'
                         jsonfiles.append(jsonfname)
 
-                        download_status.append(_download_edgar(json_url, jsonfpath))
+                        download_status.append(_download_edgar(json_url, jsonfpath, blobcache=blobcache))
 
-        jsondict['CIK'].append(cik)
-        jsondict['files'].append(jsonfiles)
-        jsondict['status'].append(download_status)
-
-        statusjsonfname = '../../data/edgar/json/status_test.json'
+        cikstatus = 1 if all(status == 1 for status in download_status) else min(download_status)
+        journal._record_(cik, cikstatus, info={'files': jsonfiles, 'status': download_status})
 
         print('+++++Finish downloading {} files for {}, status - {}+++++\n'.format(len(jsonfiles), cik, download_status))
 
-        with open(statusjsonfname, 'w') as fp:
-            json.dump(jsondict, fp)
-
         count += 1
\ No newline at end of file
@@ -0,0 +1,125 @@
+import pandas as pd
+
+import logging
+import sqlite3
+import glob
+import re
+
+from threading import Lock
+
+ARCHIVE_URL = 'https://www.sec.gov/Archives/edgar/data'
+STORE_FNAME = re.compile(r'CIK(\d{10})\.submission\.all\.pickle$')
+
+class FILINGINDEX:
+    '''
+    index over filings of all downloaded companies, keyed by (form, filingDate, cik)
+
+    the index is a sqlite database, updated company by company whenever `COMPANYFILINGJSON` refreshes one
+
+    Initialize the object
+    Params:
+    ----------
+    indexfname: str
+        path for the sqlite file, created if it does not exist
+    '''
+    def __init__(
+        self,
+        indexfname,
+        ):
+        self.logger = logging.getLogger('edgar.download')
+        self.indexfname = indexfname
+        self.lock = Lock()
+        self.conn = sqlite3.connect(self.indexfname, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS filings ('
+            'form TEXT, filingDate TEXT, cik INTEGER, accessionNumber TEXT, primaryDocument TEXT)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS filings_form_date ON filings (form, filingDate, cik)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS filings_cik ON filings (cik)')
+        self.conn.commit()
+
+    def _update_company_(self, cik, jsondataframe):
+        '''
+        replace all filings of a company in the index
+
+        Params:
+        ----------
+        cik: int or str
+        jsondataframe: pd.DataFrame
+            filings from `COMPANYFILINGJSON`, with columns form, filingDate, accessionNumber and primaryDocument
+        '''
+        cik = int(cik)
+        rows = zip(
+            jsondataframe['form'].astype(str),
+            jsondataframe['filingDate'].astype(str),
+            [cik] * len(jsondataframe),
+            jsondataframe['accessionNumber'].astype(str),
+            jsondataframe['primaryDocument'].fillna('').astype(str),
+        )
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM filings WHERE cik = ?', (cik,))
+            self.conn.executemany('INSERT INTO filings VALUES (?, ?, ?, ?, ?)', rows)
+        self.logger.info(f'{len(jsondataframe)} filings of CIK{cik:0>10} indexed...')
+
+    def _index_pickles_(self, jsonpath):
+        '''
+        index all `CIK*.submission.all.pickle` saved in `jsonpath`
+        '''
+        fnames = glob.glob(f'{jsonpath}/CIK*.submission.all.pickle')
+        self.logger.info(f'indexing {len(fnames)} companies from {jsonpath}...')
+        for fname in fnames:
+            match = STORE_FNAME.search(fname)
+            if match is None:
+                continue
+            self._update_company_(match.group(1), pd.read_pickle(fname))
+
+    def find_filings(self, form=None, start=None, end=None, ciks=None):
+        '''
+        find filings in the index
+
+        Params:
+        ----------
+        form: str, list or None
+            form type(s), e.g. '10-K'
+        start, end: str or None
+            only filings with start <= filingDate <= end ('YYYY-MM-DD')
+        ciks: list or None
+            only filings of these companies
+
+        Returns:
+        ----------
+        pd.DataFrame with columns cik, form, filingDate, accessionNumber, primaryDocument, url and fname,
+        `url` and `fname` can be fed into `_download_dataframe` directly
+        '''
+        conditions = []; params = []
+        if form is not None:
+            forms = [form] if isinstance(form, str) else list(form)
+            conditions.append('form IN ({})'.format(','.join('?' * len(forms))))
+            params.extend(forms)
+        if start is not None:
+            conditions.append('filingDate >= ?')
+            params.append(str(pd.Timestamp(start).date()))
+        if end is not None:
+            conditions.append('filingDate <= ?')
+            params.append(str(pd.Timestamp(end).date()))
+        if ciks is not None:
+            ciks = [int(cik) for cik in ciks]
+            conditions.append('cik IN ({})'.format(','.join('?' * len(ciks))))
+            params.extend(ciks)
+        query = 'SELECT cik, form, filingDate, accessionNumber, primaryDocument FROM filings'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        with self.lock:
+            df = pd.read_sql_query(query, self.conn, params=params)
+
+        accession = df['accessionNumber'].str.replace('-', '', regex=False)
+        cik = df['cik'].astype(str)
+        df['url'] = ARCHIVE_URL + '/' + cik + '/' + accession + '/' + df['primaryDocument']
+        df['fname'] = cik + '/' + df['accessionNumber'] + '/' + df['primaryDocument']
+        return df
+
+    def _close_(self):
+        '''close the index'''
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,295 @@
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pyarrow as pa
+import pandas as pd
+
+from threading import Lock
+
+import logging
+import sqlite3
+import shutil
+import os
+
+DATE_COLUMNS = ['filingDate', 'reportDate']
+CATEGORY_COLUMNS = ['form', 'exchange', 'act']
+BOOL_COLUMNS = ['isXBRL', 'isInlineXBRL']
+CATEGORY_TYPE = pa.dictionary(pa.int32(), pa.string())
+### one schema for every file, so that a company without (say) an exchange does not decide the type for all
+FILING_SCHEMA = pa.schema([
+    ('cik', pa.int64()),
+    ('accessionNumber', pa.int64()),
+    ('filingDate', pa.timestamp('ns')),
+    ('reportDate', pa.timestamp('ns')),
+    ('acceptanceDateTime', pa.timestamp('ns', tz='UTC')),
+    ('act', CATEGORY_TYPE),
+    ('form', CATEGORY_TYPE),
+    ('fileNumber', pa.string()),
+    ('filmNumber', pa.int64()),
+    ('items', pa.string()),
+    ('core_type', pa.string()),
+    ('size', pa.int64()),
+    ('isXBRL', pa.bool_()),
+    ('isInlineXBRL', pa.bool_()),
+    ('primaryDocument', pa.string()),
+    ('primaryDocDescription', pa.string()),
+    ('exchange', CATEGORY_TYPE),
+])
+YEAR_PARTITIONING = ds.partitioning(pa.schema([('year', pa.int16())]), flavor='hive')
+### names starting with `_` are not part of the dataset for pyarrow
+FILE_INDEX = '_files.sqlite'
+
+def _pack_accession_(accession):
+    '''
+    pack accession numbers (``0000012927-20-000010'') into fixed width int64 (12927200000010)
+
+    Params:
+    ----------
+    accession: pd.Series of str
+    '''
+    return pd.to_numeric(accession.str.replace('-', '', regex=False), errors='coerce').astype('Int64')
+
+def _unpack_accession_(accession):
+    '''
+    format packed accession numbers back to ``0000012927-20-000010''
+    '''
+    digits = accession.astype('int64').map('{:018d}'.format)
+    return digits.str[:10] + '-' + digits.str[10:12] + '-' + digits.str[12:]
+
+def _typed_filings_(jsondataframe, cik, exchange=None):
+    '''
+    convert a filing dataframe from submission json files into typed columns
+
+    Params:
+    ----------
+    jsondataframe: pd.DataFrame
+        filings from `COMPANYFILINGJSON` (one row per filing, every column is a python object)
+    cik: int or str
+    exchange: str or None
+        exchange of the company, saved as a column
+
+    filings without a valid filing date are dropped
+    '''
+    df = jsondataframe.copy()
+    df.insert(0, 'cik', int(cik))
+    df['exchange'] = exchange
+    df['accessionNumber'] = _pack_accession_(df['accessionNumber'].astype(str))
+    for col in DATE_COLUMNS:
+        if col in df:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    if 'acceptanceDateTime' in df:
+        df['acceptanceDateTime'] = pd.to_datetime(df['acceptanceDateTime'], errors='coerce', utc=True)
+    for col in BOOL_COLUMNS:
+        if col in df:
+            df[col] = df[col].astype(bool)
+    for col in ['size', 'filmNumber']:
+        if col in df:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+    for col in CATEGORY_COLUMNS:
+        if col in df:
+            df[col] = df[col].astype('category')
+    invalid = df['filingDate'].isna()
+    if invalid.any():
+        logging.getLogger('edgar.download').warning(
+            '{} filings of CIK{:0>10} without a valid filing date dropped...'.format(invalid.sum(), cik)
+        )
+        df = df[~invalid]
+    df['year'] = df['filingDate'].dt.year.astype('int16')
+    return df
+
+def _filings_table_(df):
+    '''
+    arrow table of typed filings in FILING_SCHEMA plus the `year` partition column,
+    columns not in the schema are dropped and missing ones are filled with nulls
+    '''
+    schema = FILING_SCHEMA.append(pa.field('year', pa.int16()))
+    arrays = [
+        pa.array(df[field.name], type=field.type, from_pandas=True) if field.name in df else pa.nulls(len(df), field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+class FILINGSTORE:
+    '''
+    object for saving company filings in a parquet dataset partitioned by filing year
+
+    forms, exchanges and acts are saved as dictionary (categorical) columns, dates as datetime64
+    and accession numbers as fixed width int64 (see `_pack_accession_`).
+    a sqlite index `$storedir/_files.sqlite` lists the files holding the filings of every company,
+    so replacing a company only touches its own files
+
+    Initialize the object
+    Params:
+    ----------
+    storedir: str
+        directory of the dataset
+    '''
+    def __init__(
+        self,
+        storedir,
+        ):
+        self.logger = logging.getLogger('edgar.download')
+        self.storedir = storedir
+        if not os.path.exists(self.storedir):
+            os.makedirs(self.storedir, exist_ok=True)
+        self.lock = Lock()
+        self._connect_()
+
+    def _connect_(self):
+        '''open the file index, stores written before the index existed are indexed once'''
+        indexfname = f'{self.storedir}/{FILE_INDEX}'
+        unindexed = not os.path.exists(indexfname) and self._partitions_()
+        self.conn = sqlite3.connect(indexfname, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS files (cik INTEGER, path TEXT, PRIMARY KEY (cik, path))')
+        self.conn.commit()
+        if unindexed:
+            self.logger.info('indexing files in {}...'.format(self.storedir))
+            self._index_([
+                f'{partition}/{fname}' for partition in self._partitions_()
+                for fname in os.listdir(f'{self.storedir}/{partition}') if fname.endswith('.parquet')
+            ])
+
+    def _partitions_(self):
+        '''names of the partition directories in the store'''
+        return [
+            partition for partition in os.listdir(self.storedir)
+            if not partition.startswith(('_', '.')) and os.path.isdir(f'{self.storedir}/{partition}')
+        ]
+
+    def _index_(self, paths):
+        '''add files (paths relative to `storedir`) to the file index under every cik they hold'''
+        rows = []
+        for path in paths:
+            ciks = pc.unique(pq.read_table(f'{self.storedir}/{path}', columns=['cik'])['cik'])
+            rows.extend((cik, path) for cik in ciks.to_pylist())
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO files (cik, path) VALUES (?, ?)', rows)
+
+    def _removecik_(self, cik):
+        '''
+        remove filings of a company from all partitions
+
+        the files are looked up in the file index, and the whole removal runs in one write transaction,
+        so processes rewriting the same compacted file wait for each other instead of losing deletions
+        '''
+        cik = int(cik)
+        with self.lock, self.conn:
+            self.conn.execute('BEGIN IMMEDIATE')
+            paths = [path for (path,) in self.conn.execute('SELECT path FROM files WHERE cik = ?', (cik,))]
+            for path in paths:
+                fpath = f'{self.storedir}/{path}'
+                if not os.path.exists(fpath):
+                    continue
+                if os.path.basename(path).startswith('part-'):
+                    ### compacted files, rewrite without the company
+                    table = pq.read_table(fpath)
+                    pq.write_table(table.filter(pc.not_equal(table['cik'], cik)), f'{fpath}.tmp')
+                    os.replace(f'{fpath}.tmp', fpath)
+                else:
+                    os.remove(fpath)
+            self.conn.execute('DELETE FROM files WHERE cik = ?', (cik,))
+
+    def _write_(self, jsondataframe, cik, exchange=None, replace=True):
+        '''
+        save (or replace) filings of a company
+
+        Params:
+        ----------
+        jsondataframe: pd.DataFrame
+            filings from `COMPANYFILINGJSON`
+        cik: int or str
+        exchange: str or None
+        replace: bool
+            remove filings of the company saved before, turn it off when the store is built
+            from scratch (e.g. a bulk build into an empty store)
+        '''
+        df = _typed_filings_(jsondataframe, cik, exchange)
+        if replace:
+            self._removecik_(cik)
+        self.logger.info('saving {} filings of CIK{:0>10} to {}...'.format(len(df), cik, self.storedir))
+        written = []
+        ds.write_dataset(
+            _filings_table_(df),
+            self.storedir,
+            format='parquet',
+            partitioning=YEAR_PARTITIONING,
+            basename_template='CIK{:0>10}-{{i}}.parquet'.format(cik),
+            existing_data_behavior='overwrite_or_ignore',
+            file_visitor=lambda writtenfile: written.append(os.path.relpath(writtenfile.path, self.storedir)),
+        )
+        with self.lock, self.conn:
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO files (cik, path) VALUES (?, ?)', [(int(cik), path) for path in written]
+            )
+
+    def _dataset_(self):
+        '''the whole store as a pyarrow dataset'''
+        return ds.dataset(
+            self.storedir, format='parquet', partitioning=YEAR_PARTITIONING,
+            schema=FILING_SCHEMA.append(pa.field('year', pa.int16())),
+        )
+
+    def _load_(self, columns=None, forms=None, start=None, end=None, ciks=None):
+        '''
+        load filings, only reading the columns and partitions needed
+
+        Params:
+        ----------
+        columns: list or None
+            columns to load, all columns by default
+        forms: str, list or None
+            only load these form types
+        start, end: str, datetime or None
+            only load filings with start <= filingDate <= end
+        ciks: list or None
+            only load these companies
+
+        Returns:
+        ----------
+        pd.DataFrame
+        '''
+        if not self._partitions_():
+            return pd.DataFrame(columns=columns)
+        dataset = self._dataset_()
+        filterexpr = None
+        def _and(expr):
+            return expr if filterexpr is None else filterexpr & expr
+        if forms is not None:
+            if isinstance(forms, str):
+                forms = [forms]
+            filterexpr = _and(ds.field('form').isin(forms))
+        if start is not None:
+            start = pd.Timestamp(start)
+            filterexpr = _and(ds.field('year') >= start.year)
+            filterexpr = _and(ds.field('filingDate') >= pa.scalar(start, type=pa.timestamp('ns')))
+        if end is not None:
+            end = pd.Timestamp(end)
+            filterexpr = _and(ds.field('year') <= end.year)
+            filterexpr = _and(ds.field('filingDate') <= pa.scalar(end, type=pa.timestamp('ns')))
+        if ciks is not None:
+            filterexpr = _and(ds.field('cik').isin([int(cik) for cik in ciks]))
+        table = dataset.to_table(columns=columns, filter=filterexpr)
+        return table.to_pandas()
+
+    def _compact_(self):
+        '''
+        rewrite every partition into a single file, for faster universe-wide loading
+        '''
+        table = self._dataset_().to_table()
+        tmpdir = f'{self.storedir}.compact'
+        ds.write_dataset(
+            table, tmpdir, format='parquet',
+            partitioning=YEAR_PARTITIONING,
+            basename_template='part-{i}.parquet',
+        )
+        self._close_()
+        shutil.rmtree(self.storedir)
+        os.replace(tmpdir, self.storedir)
+        ### the compacted store has no file index yet, it is built from the new files
+        self._connect_()
+
+    def _close_(self):
+        '''close the file index'''
+        with self.lock:
+            self.conn.close()
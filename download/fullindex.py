@@ -0,0 +1,143 @@
+# Build download plans from EDGAR quarterly full-index files (form.idx / master.idx)
+
+from download import DOWNLOADER
+import pandas as pd
+import argparse
+import os
+
+FULLINDEX_URL = 'https://www.sec.gov/Archives/edgar/full-index'
+ARCHIVES_URL = 'https://www.sec.gov/Archives'
+FORM_COLUMNS = ['Form Type', 'Company Name', 'CIK', 'Date Filed', 'File Name']
+
+def _quarters(start, end):
+    '''
+    All (year, quarter) between two dates
+    '''
+    start = pd.Timestamp(start); end = pd.Timestamp(end)
+    year, qtr = start.year, (start.month - 1) // 3 + 1
+    while (year, qtr) <= (end.year, (end.month - 1) // 3 + 1):
+        yield year, qtr
+        qtr += 1
+        if qtr > 4:
+            year += 1; qtr = 1
+
+def _download_index(year, qtr, indexdir, kind='form', cache=None):
+    '''
+    Download a quarterly index file, return the local path or None if it failed
+
+    Parameters:
+    ------------
+    year, qtr: int
+    indexdir: str
+        Directory for saving index files, as `<indexdir>/<year>/QTR<qtr>/<kind>.idx`
+    kind: str
+        `form` or `master`
+    cache: HTTPCACHE or None
+        Cache for conditional requests, the index of a finished quarter does not change
+    '''
+    url = f'{FULLINDEX_URL}/{year}/QTR{qtr}/{kind}.idx'
+    path = f'{indexdir}/{year}/QTR{qtr}/{kind}.idx'
+    downloader = DOWNLOADER(url, path, maxiter=5, cache=cache)
+    if downloader._iterdownload_() != 1:
+        return None
+    return path
+
+def _iter_index(fname):
+    '''
+    Stream rows of a form.idx or master.idx file, one line at a time
+
+    form.idx is fixed width, the column positions are read from its header line;
+    master.idx is delimited by `|`
+
+    Yields:
+    ------------
+    (cik, company, form, date filed, file name)
+    '''
+    with open(fname, encoding='latin-1') as fp:
+        ### header, until the line of dashes
+        slices = None; delimited = False
+        for line in fp:
+            if line.startswith('CIK|Company Name|'):
+                delimited = True
+            elif line.startswith('Form Type'):
+                starts = [line.index(col) for col in FORM_COLUMNS]
+                slices = [slice(a, b) for a, b in zip(starts, starts[1:] + [None])]
+            elif line.startswith('-----'):
+                break
+        if not delimited and slices is None:
+            raise ValueError(f'{fname} is neither a form.idx nor a master.idx file... Aborted...')
+
+        for line in fp:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            if delimited:
+                cik, company, form, datefiled, filename = line.split('|')
+            else:
+                form, company, cik, datefiled, filename = [line[s].strip() for s in slices]
+            yield cik, company, form, datefiled, filename
+
+def _build_plan(indexfnames, forms=None, start=None, end=None):
+    '''
+    Filter index files by form type and date in one pass and build a download plan
+
+    Parameters:
+    ------------
+    indexfnames: list
+        Paths for form.idx / master.idx files
+    forms: list or None
+        Form types to keep, e.g. ['10-K', '10-K405'], all forms by default
+    start, end: str or None
+        Only keep filings with start <= Date Filed <= end ('YYYY-MM-DD')
+
+    Returns:
+    ------------
+    DataFrame with columns cik, company, form, filingDate, url and fname,
+    `fname` is `<cik>/<file name>` so the same filing always goes to the same place
+    '''
+    forms = None if forms is None else set(forms)
+    start = None if start is None else str(pd.Timestamp(start).date())
+    end = None if end is None else str(pd.Timestamp(end).date())
+
+    rows = []
+    for indexfname in indexfnames:
+        for cik, company, form, datefiled, filename in _iter_index(indexfname):
+            if forms is not None and form not in forms:
+                continue
+            ### dates are yyyy-mm-dd (form.idx/master.idx since 1993), compared as strings
+            if (start is not None and datefiled < start) or (end is not None and datefiled > end):
+                continue
+            rows.append((int(cik), company, form, datefiled, filename))
+
+    plan = pd.DataFrame(rows, columns=['cik', 'company', 'form', 'filingDate', 'filename'])
+    plan['url'] = ARCHIVES_URL + '/' + plan['filename']
+    plan['fname'] = plan['cik'].astype(str) + '/' + plan['filename'].str.split('/').str[-1]
+    plan = plan.drop(columns='filename').drop_duplicates('url').reset_index(drop=True)
+    return plan
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a download plan from EDGAR quarterly full-index files')
+    parser.add_argument('out', type=str, help='Path for saving the plan (pickle), use it with download_dataframe.py --url url --file fname')
+    parser.add_argument('--forms', type=str, nargs='+', default=None, help='Form types to keep')
+    parser.add_argument('--start', type=str, required=True, help='Start date (YYYY-MM-DD)')
+    parser.add_argument('--end', type=str, required=True, help='End date (YYYY-MM-DD)')
+    parser.add_argument('--indexdir', type=str, default='./full-index', help='Directory for saving index files')
+    parser.add_argument('--local', type=int, default=0, choices={0, 1}, help='1 if index files are already in indexdir (no downloading)')
+    parser.add_argument('--kind', type=str, default='form', choices={'form', 'master'}, help='Type of index files')
+
+    args = parser.parse_args()
+
+    indexfnames = []
+    for year, qtr in _quarters(args.start, args.end):
+        if args.local:
+            indexfname = f'{args.indexdir}/{year}/QTR{qtr}/{args.kind}.idx'
+        else:
+            indexfname = _download_index(year, qtr, args.indexdir, args.kind)
+        if indexfname is None or not os.path.exists(indexfname):
+            print(f'[info] index file for {year} QTR{qtr} not found')
+            continue
+        indexfnames.append(indexfname)
+
+    plan = _build_plan(indexfnames, args.forms, args.start, args.end)
+    plan.to_pickle(args.out)
+    print(f'[info] {len(plan)} filings in the plan')
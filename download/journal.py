@@ -0,0 +1,127 @@
+import logging
+import sqlite3
+import json
+
+from threading import Lock
+
+class JOBJOURNAL:
+    '''
+    append-only journal for download jobs, one record per attempt of a job
+
+    the journal is a sqlite database in WAL mode, so a crash never corrupts the records written before.
+    records are never replaced, the view `jobs` gives the latest attempt of every job;
+    restarting a run skips the jobs whose latest attempt was successful
+
+    Initialize the object
+    Params:
+    ----------
+    journalfname: str
+        path for the sqlite file, created if it does not exist
+    '''
+    def __init__(
+        self,
+        journalfname,
+        ):
+        self.logger = logging.getLogger('edgar.download')
+        self.journalfname = journalfname
+        self.lock = Lock()
+        self.conn = sqlite3.connect(self.journalfname, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS attempts ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, jobid TEXT, status INTEGER, info TEXT, '
+            'finished REAL DEFAULT (julianday(\'now\')))'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS attempts_jobid ON attempts (jobid, id)')
+        ### journals written before kept one row per job in a `jobs` table, move them over
+        if self.conn.execute('SELECT 1 FROM sqlite_master WHERE type = \'table\' AND name = \'jobs\'').fetchone():
+            self.conn.execute(
+                'INSERT INTO attempts (jobid, status, info, finished) '
+                'SELECT jobid, status, info, finished FROM jobs ORDER BY finished'
+            )
+            self.conn.execute('DROP TABLE jobs')
+        self.conn.execute(
+            'CREATE VIEW IF NOT EXISTS jobs AS SELECT jobid, status, info, finished FROM attempts '
+            'WHERE id IN (SELECT MAX(id) FROM attempts GROUP BY jobid)'
+        )
+        self.conn.commit()
+        ### keep finished jobs in memory for checking in O(1)
+        self.finished = set(
+            jobid for (jobid,) in self.conn.execute('SELECT jobid FROM jobs WHERE status = 1')
+        )
+        self.logger.info('{} finished jobs loaded from {}...'.format(len(self.finished), self.journalfname))
+
+    def _done_(self, jobid):
+        '''check if `jobid` has been finished successfully'''
+        return jobid in self.finished
+
+    def _record_(self, jobid, status, info=None):
+        '''
+        record the status of a finished attempt of a job, the latest attempt decides the status of the job
+
+        Params:
+        ----------
+        jobid: str
+        status: int
+            1 for success, any other value is treated as failed and will be run again
+        info: json serializable object or None
+            extra information saved with the job
+        '''
+        with self.lock:
+            self.conn.execute(
+                'INSERT INTO attempts (jobid, status, info) VALUES (?, ?, ?)',
+                (jobid, int(status), None if info is None else json.dumps(info)),
+            )
+            self.conn.commit()
+            if status == 1:
+                self.finished.add(jobid)
+            else:
+                self.finished.discard(jobid)
+
+    def _remaining_(self, jobids):
+        '''
+        return jobs in `jobids` that have not been finished successfully, in the same order
+        '''
+        return [jobid for jobid in jobids if jobid not in self.finished]
+
+    def _failed_(self):
+        '''
+        return a dictionary of jobs recorded with a failed status, jobid -> status
+        '''
+        with self.lock:
+            return dict(self.conn.execute('SELECT jobid, status FROM jobs WHERE status != 1'))
+
+    def _status_(self, jobids):
+        '''
+        return the recorded status of each job in `jobids`, None for jobs never recorded
+        '''
+        with self.lock:
+            recorded = dict(self.conn.execute('SELECT jobid, status FROM jobs'))
+        return [recorded.get(jobid) for jobid in jobids]
+
+    def _attempts_(self, jobid):
+        '''
+        return every recorded attempt of `jobid`, oldest first, as a list of (status, info, finished julian day)
+        '''
+        with self.lock:
+            records = self.conn.execute(
+                'SELECT status, info, finished FROM attempts WHERE jobid = ? ORDER BY id', (jobid,)
+            ).fetchall()
+        return [(status, None if info is None else json.loads(info), finished) for status, info, finished in records]
+
+    def _info_(self):
+        '''
+        return a dictionary of all recorded jobs, jobid -> (status, info) of the latest attempt
+        '''
+        with self.lock:
+            records = self.conn.execute('SELECT jobid, status, info FROM jobs').fetchall()
+        return {
+            jobid: (status, None if info is None else json.loads(info))
+            for jobid, status, info in records
+        }
+
+    def _close_(self):
+        '''close the journal'''
+        with self.lock:
+            self.conn.close()
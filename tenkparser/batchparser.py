@@ -0,0 +1,180 @@
+### parsing a batch of 10-k html files over a process pool
+from parsecache import PARSECACHE, _parse_cached_
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from time import perf_counter
+import pandas as pd
+import argparse
+import resource
+import signal
+import glob
+import os
+
+ITEMS = ('I7', 'I7A', 'I8')
+
+_cache = None
+
+class _ParseTimeout(Exception):
+    pass
+
+def _raise_timeout(signum, frame):
+    raise _ParseTimeout()
+
+def _init_worker(memlimit, cachefname=None):
+    '''
+    limit the address space of a worker process to `memlimit` bytes (None for no limit)
+    and open the parse cache `cachefname` (None for no cache) once per worker
+    '''
+    global _cache
+    if cachefname is not None:
+        _cache = PARSECACHE(cachefname)
+    if memlimit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memlimit, memlimit))
+    signal.signal(signal.SIGALRM, _raise_timeout)
+
+def _parse_one(htmlpath, backend='lxml', items=ITEMS, scorethreshold=1, timeout=None):
+    '''
+    run all TENKPARSER stages on one file without writing anything to the disk,
+    results are taken from the worker's parse cache if the file has been parsed before
+
+    Returns:
+    ------------
+    dict - one row of the manifest
+    '''
+    row = {'htmlpath': htmlpath, 'status': 'ok', 'error': '', 'seconds': 0.0, 'bytes': 0}
+    start = perf_counter()
+    if timeout is not None:
+        signal.alarm(int(timeout))
+    try:
+        row['bytes'] = os.path.getsize(htmlpath)
+        results = _parse_cached_(htmlpath, _cache, backend, items, scorethreshold)
+        for item in items:
+            row[f'{item}_anchor'] = results['itemanchor'][item][0] if results['itemanchor'][item] else None
+            row[f'{item}_idx'] = results['anchoridx'].get(item, -1)
+            row[f'{item}_start'], row[f'{item}_end'] = results['sectionoffset'].get(item, (-1, -1))
+        row['check'] = ';'.join(f'{logname}:{message}' for logname, message in results['checks'].items())
+    except _ParseTimeout:
+        row['status'] = 'timeout'
+    except MemoryError:
+        row['status'] = 'memory'
+    except Exception as Excpt:
+        row['status'] = 'error'
+        row['error'] = repr(Excpt)
+    finally:
+        if timeout is not None:
+            signal.alarm(0)
+    row['seconds'] = perf_counter() - start
+    return row
+
+def _run_pool(htmlpaths, initargs, parseargs, maxworkers, onrow):
+    '''
+    parse files over one process pool, `onrow` is called with each finished row
+
+    Returns:
+    ------------
+    list of files left unparsed because a worker died and broke the pool
+    '''
+    broken = []
+    with ProcessPoolExecutor(max_workers=maxworkers, initializer=_init_worker, initargs=initargs) as executor:
+        futures = {executor.submit(_parse_one, htmlpath, *parseargs): htmlpath for htmlpath in htmlpaths}
+        for future in as_completed(futures):
+            try:
+                onrow(future.result())
+            except BrokenProcessPool:
+                broken.append(futures[future])
+    return broken
+
+def _parse_isolated(htmlpath, initargs, parseargs):
+    '''
+    parse one file in a process of its own, so a crash is only recorded for the file that caused it
+    '''
+    try:
+        with ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=initargs) as executor:
+            return executor.submit(_parse_one, htmlpath, *parseargs).result()
+    except BrokenProcessPool as Excpt:
+        ### the worker died (e.g. killed by the system, or out of memory in C code)
+        return {'htmlpath': htmlpath, 'status': 'crashed', 'error': repr(Excpt)}
+
+def _parse_batch(htmlpaths, manifestfname, maxworkers=None, timeout=300, memlimit=None, backend='lxml', items=ITEMS, scorethreshold=1, reportevery=100, cachefname=None):
+    '''
+    Parse a list of 10-k html files over a process pool and save one manifest table
+
+    Parameters:
+    ------------
+    htmlpaths: list or str
+        List of html files, or a glob pattern
+    manifestfname: str
+        Path for saving the manifest (pickle), one row per file with anchors, indexes, section offsets and check messages
+    maxworkers: int or None
+        Number of processes, all cores by default
+    timeout: int or None
+        Seconds allowed for each file, checked with SIGALRM in the worker: a long call in C code
+        (e.g. lxml parsing a huge file) is only stopped when it returns, use memlimit to bound those
+    memlimit: int or None
+        Maximum memory (bytes) of each worker process, a file exceeding it is recorded as `memory`,
+        or as `crashed` if the worker dies of it
+    backend: str
+        `lxml` or `soup`, see TENKPARSER
+    items: tuple
+        Items to find
+    reportevery: int
+        Print progress and throughput after this many files
+    cachefname: str or None
+        Path for the PARSECACHE sqlite file, unchanged files are not parsed again if given
+
+    Returns:
+    ------------
+    the manifest as a DataFrame
+    '''
+    if isinstance(htmlpaths, str):
+        htmlpaths = sorted(glob.glob(htmlpaths, recursive=True))
+    print(f'[info] parsing {len(htmlpaths)} files')
+
+    rows = []
+    start = perf_counter(); nbytes = 0
+    def _onrow(row):
+        nonlocal nbytes
+        rows.append(row)
+        nbytes += row.get('bytes', 0)
+        if len(rows) % reportevery == 0 or len(rows) == len(htmlpaths):
+            elapsed = perf_counter() - start
+            print('[info] {}/{} files parsed - {:.1f} files/s, {:.1f} MB/s'.format(
+                len(rows), len(htmlpaths), len(rows) / elapsed, nbytes / elapsed / 1e6
+            ))
+
+    initargs = (memlimit, cachefname)
+    parseargs = (backend, items, scorethreshold, timeout)
+    ### a dying worker breaks the whole pool, unfinished files go to a new pool
+    ### until a pool finishes nothing, then the rest are parsed one process per file
+    pending = list(htmlpaths)
+    while pending:
+        broken = _run_pool(pending, initargs, parseargs, maxworkers, _onrow)
+        if not broken:
+            break
+        print(f'[info] a worker died, {len(broken)} files left unparsed')
+        if len(broken) == len(pending):
+            with ThreadPoolExecutor(max_workers=maxworkers or os.cpu_count()) as threads:
+                for row in threads.map(lambda htmlpath: _parse_isolated(htmlpath, initargs, parseargs), broken):
+                    _onrow(row)
+            break
+        pending = broken
+
+    manifest = pd.DataFrame(rows)
+    manifest.to_pickle(manifestfname)
+    print('[info] status - {}'.format(manifest['status'].value_counts().to_dict()))
+    return manifest
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parse 10-k html files over a process pool')
+    parser.add_argument('pattern', type=str, help='Glob pattern for html files (quote it), e.g. "data/**/*.htm"')
+    parser.add_argument('manifest', type=str, help='Path for saving the manifest (pickle)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes, all cores by default')
+    parser.add_argument('--timeout', type=int, default=300, help='Seconds allowed for each file')
+    parser.add_argument('--memlimit', type=float, default=None, help='Maximum memory of each worker in GB')
+    parser.add_argument('--backend', type=str, default='lxml', choices={'lxml', 'soup'}, help='Parser backend')
+    parser.add_argument('--cache', type=str, default=None, help='Path for the parse cache (sqlite), optional')
+
+    args = parser.parse_args()
+
+    memlimit = None if args.memlimit is None else int(args.memlimit * 1024**3)
+    _parse_batch(args.pattern, args.manifest, args.workers, args.timeout, memlimit, args.backend, cachefname=args.cache)
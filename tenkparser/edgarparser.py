@@ -1,10 +1,69 @@
 ### attempt to parsing 10-k html file
+from itemscorer import DEFAULT_SCORER
+from tableparser import _tablecells_, _numericcells_
+from utils import _openfile_, _mapfile_, _compresswriter_
 from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
 import logging
 import pickle
 import os
 import re
 
+### bump when a change in TENKPARSER changes its results (invalidates parsecache.PARSECACHE)
+PARSER_VERSION = 3
+
+### patterns for the _matchitem*_ functions, compiled once
+ITEMSEVEN_PATS = [
+    re.compile(r'item\s*7[^A-Z]', re.IGNORECASE),
+    re.compile(r'discussion\s*and\s*analysis', re.IGNORECASE),
+    re.compile(r'financial\s*condition', re.IGNORECASE),
+]
+ITEMSEVENA_PATS = [
+    re.compile(r'item\s*7A', re.IGNORECASE),
+    re.compile(r'quantitative\s*and\s*qualitative\s*disclosures', re.IGNORECASE),
+    re.compile(r'market\s*risk', re.IGNORECASE),
+]
+ITEMEIGHT_PATS = [
+    re.compile(r'item\s*8[^A-Z]', re.IGNORECASE),
+    re.compile(r'financial\s*statements', re.IGNORECASE),
+    re.compile(r'supplementary\s*data', re.IGNORECASE),
+]
+
+### a new line is added after block level tags and a space after table cells when converting html to text
+BLOCK_END = re.compile(rb'(</(?:p|div|tr|li|table|h[1-6]|title)\s*>|<br\s*/?>)', re.IGNORECASE)
+CELL_END = re.compile(rb'(</t[dh]\s*>)', re.IGNORECASE)
+### a doctype in the file itself (before any element), libxml2 makes up one for files without
+DOCTYPE_HEAD = re.compile(rb'^(?:\xef\xbb\xbf)?(?:\s|<\?[^>]*>|<!--.*?-->)*<!doctype', re.IGNORECASE | re.DOTALL)
+
+def _htmltotext_(htmlbytes, encoding='utf-8'):
+    '''
+    convert an html fragment (bytes) into plain text, with a new line after each block level tag
+    '''
+    if not htmlbytes.strip():
+        return ''
+    htmlbytes = CELL_END.sub(rb'\1 ', BLOCK_END.sub(rb'\1\n', htmlbytes))
+    root = lxml.html.fragment_fromstring(htmlbytes.decode(encoding, errors='replace'), create_parent='div')
+    return root.text_content()
+
+class LXMLTAG:
+    '''
+    light-weight stand-in for a beautifulsoup tag, made from an lxml element
+
+    only keeps what TENKPARSER needs: `attrs` and the html string of the tag
+    '''
+    __slots__ = ('attrs', 'html')
+
+    def __init__(self, element):
+        self.attrs = dict(element.attrib)
+        self.html = etree.tostring(element, encoding=str, method='html', with_tail=False)
+
+    def __str__(self):
+        return self.html
+
+    def __repr__(self):
+        return self.html
+
 class TENKPARSER:
     '''
     Object for parsing 10-k html file
@@ -13,6 +72,8 @@ class TENKPARSER:
         self,
         tenkhtmlpath,
         workdir,
+        backend='soup',
+        scorer=None,
         ):
         '''
         initialize TENKPARSER object
@@ -21,53 +82,121 @@ class TENKPARSER:
         ----------
         tenkhtmlpath: str
             path for saving 10-k file
-        workdir: str
-            directory for saving various ~temp files
+        workdir: str or None
+            directory for saving various ~temp files, nothing is saved if None
+            (the results and check messages are still kept in the object, see `self.checks`)
+        backend: str
+            `soup` for parsing with beautifulsoup, `lxml` for working on an lxml tree directly,
+            which is much faster and lighter for large (inline xbrl) filings
+        scorer: ITEMSCORER or None
+            scorer for matching a tags to items, `itemscorer.DEFAULT_SCORER` by default
         '''
         self.logger = logging.getLogger('edgar.tenk')
         self.workdir = workdir
-        if not os.path.exists(self.workdir):
-            os.makedirs(self.workdir)
-        self.logger.info(f'setting work directory to {self.workdir}')
+        if self.workdir is not None:
+            if not os.path.exists(self.workdir):
+                os.makedirs(self.workdir)
+            self.logger.info(f'setting work directory to {self.workdir}')
+        self.checks = {}
         self.htmlpath = tenkhtmlpath
-        ### run _souphtml_ function
-        self._souphtml_()
+        if backend not in ['soup', 'lxml']:
+            raise ValueError(f'backend should be either `soup` or `lxml`, but {backend} given... Aborted...')
+        self.backend = backend
+        self.scorer = scorer if scorer is not None else DEFAULT_SCORER
+        ### run _souphtml_/_lxmlhtml_ function
+        if self.backend == 'soup':
+            self._souphtml_()
+        else:
+            self._lxmlhtml_()
         ### make a status dictionary for checking purpose
         
     def _souphtml_(self):
         '''parsing the html file to a beautiful soup'''
         self.logger.info('parsing the html file into a beautifulsoup object...')
-        with open(self.htmlpath) as fp:
+        with _openfile_(self.htmlpath, 'r') as fp:
             self.soup = BeautifulSoup(fp.read(), 'lxml')
 
-    def _finditemhref_(self, scorethreshold = 1):
-        '''finding all hyperlinks in the file and match to item7/7A/8'''
+    def _lxmlhtml_(self):
+        '''parsing the html file to an lxml tree'''
+        self.logger.info('parsing the html file into an lxml tree...')
+        with _openfile_(self.htmlpath, 'rb') as fp:
+            self.hasdoctype = DOCTYPE_HEAD.match(fp.read(4096)) is not None
+        with _openfile_(self.htmlpath, 'rb') as fp:
+            self.tree = lxml.html.parse(fp)
+        self.htmlstr = None
+
+    def _findatags_(self):
+        '''find all `<a>` tags in the html file'''
+        if self.backend == 'soup':
+            return self.soup.findAll('a')
+        return [LXMLTAG(atag) for atag in self.tree.iter('a')]
+
+    def _findattrtags_(self, attr, value):
+        '''find html strings of all tags whose `attr` equals `value`'''
+        if self.backend == 'soup':
+            return [i.__str__() for i in self.soup.find_all(attrs={attr:value})]
+        return [
+            etree.tostring(tag, encoding=str, method='html', with_tail=False)
+            for tag in self.tree.xpath(f'//*[@{attr}=$value]', value=value)
+        ]
+
+    def _htmlstr_(self):
+        '''the whole document as a string'''
+        if self.backend == 'soup':
+            return self.soup.__str__()
+        if self.htmlstr is None:
+            ### same as the soup string: the doctype is only kept if the file has one
+            root = self.tree if self.hasdoctype else self.tree.getroot()
+            self.htmlstr = etree.tostring(root, encoding=str, method='html')
+        return self.htmlstr
+
+    def _savework_(self, fname, obj):
+        '''pickle `obj` to $workdir/`fname` if there is a workdir'''
+        if self.workdir is None:
+            return
+        with open(f'{self.workdir}/{fname}', 'wb') as fp:
+            pickle.dump(obj, fp)
+
+    def _savecheck_(self, logname, checkmessage, what):
+        '''keep check messages in self.checks and save them to $workdir/`logname` if there is a workdir'''
+        if not checkmessage:
+            return
+        self.checks[logname] = checkmessage
+        if self.workdir is None:
+            self.logger.warning(f'please check {what} manually...')
+            return
+        self.logger.warning(f'please check {what} manually... check messages have been saved in $workdir...')
+        with open(f'{self.workdir}/{logname}', 'w') as fp:
+            fp.write(checkmessage)
+
+    def _finditemhref_(self, scorethreshold = 1, items = ('I7', 'I7A', 'I8')):
+        '''
+        finding all hyperlinks in the file and match to items (item7/7A/8 by default)
+        every tag is scanned once by self.scorer, which scores all items together;
+        tags of the other items are kept in self.boundtagmatch, their anchors only mark where sections end
+        '''
         self.logger.info('finding all hyperlinks in the html file...')
-        ataglst = self.soup.findAll('a')
+        ataglst = self._findatags_()
         self.logger.debug('{} a tags found in the html file...'.format(len(ataglst)))
 
-        cutdict = {'I7':[], 'I7A':[], 'I8':[]}
-        #check item7/7A/8 from all ataglst
+        cutdict = {item:[] for item in items}
+        bounddict = {item:[] for item in self.scorer.items if item not in cutdict}
+        #check items from all ataglst
         # only keep html tag above the score threshold...
-        self.logger.info('finding item 7/7A/8 tags in all atags...')
+        self.logger.info('finding {} tags in all atags...'.format('/'.join(items)))
         for atag in ataglst:
-            score = self._matchitemseven_(atag)
-            if score > scorethreshold: cutdict['I7'].append(atag)
-            score = self._matchitemeight_(atag)
-            if score > scorethreshold: cutdict['I8'].append(atag)
-            score = self._matchitemsevenA_(atag)
-            if score > scorethreshold: cutdict['I7A'].append(atag)
+            scores = self.scorer._score_(atag)
+            for item in items:
+                if scores[item] > scorethreshold: cutdict[item].append(atag)
+            for item in bounddict:
+                if scores[item] > scorethreshold: bounddict[item].append(atag)
         self.logger.info(
-            '{} item7 tags found, {} item7A tags found and {} item8 tags'.format(
-                len(cutdict['I7']),
-                len(cutdict['I7A']),
-                len(cutdict['I8'])
-                )
+            ', '.join('{} {} tags found'.format(len(cutdict[item]), item) for item in items)
             )
         self.logger.info('saving matched dictionary to $workdir...')
         self.hreftagmatch = cutdict
-        with open(f'{self.workdir}/hrefmatch.dict.pickle', 'wb') as fp:
-            pickle.dump(self.hreftagmatch.__str__(), fp)
+        self.boundtagmatch = bounddict
+        self._savework_('hrefmatch.dict.pickle', self.hreftagmatch.__str__())
 
     def _matchscore_(self, repats, weights, htmltag):
         '''
@@ -77,12 +206,12 @@ class TENKPARSER:
         if not isinstance(htmltag, str):
             htmltag = htmltag.__str__()
 
-        self.logger.debug(f'evaluating scores for htmltag - {htmltag}...')
         score = 0
         for repat, weight in zip(repats, weights):
-            if len(re.findall(repat, htmltag)) > 0:
+            if repat.search(htmltag) is not None:
                 score += weight
-        self.logger.debug(f'score: {score}')
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f'evaluating scores for htmltag - {htmltag}... score: {score}')
         return score
 
     def _matchitemseven_(self, htmltag, weights=[3,1,1]):
@@ -92,14 +221,8 @@ class TENKPARSER:
         ``item<space>7''
         ``Management's discussion and analysis of financial condition and results of operations''
         '''
-        repats = [
-            re.compile(r'item\s*7[^A-Z]', re.IGNORECASE),
-            re.compile(r'discussion\s*and\s*analysis', re.IGNORECASE),
-            re.compile(r'financial\s*condition', re.IGNORECASE),
-        ]
-
         ### give the score of a htmltag to be the target tag
-        return self._matchscore_(repats, weights, htmltag)
+        return self._matchscore_(ITEMSEVEN_PATS, weights, htmltag)
 
     def _matchitemsevenA_(self, htmltag, weights=[3,1,1]):
         '''
@@ -108,13 +231,7 @@ class TENKPARSER:
         ``item<space>7A''
         ``Quantitative and Qualitative Disclosures about Market Risk''
         '''
-        repats = [
-            re.compile(r'item\s*7A', re.IGNORECASE),
-            re.compile(r'quantitative\s*and\s*qualitative\s*disclosures', re.IGNORECASE),
-            re.compile(r'market\s*risk', re.IGNORECASE),
-        ]
-
-        return self._matchscore_(repats, weights, htmltag)
+        return self._matchscore_(ITEMSEVENA_PATS, weights, htmltag)
 
     def _matchitemeight_(self, htmltag, weights=[3,1,1]):
         '''
@@ -123,13 +240,7 @@ class TENKPARSER:
         ``item<space>8''
         ``
         '''
-        repats = [
-            re.compile(r'item\s*8[^A-Z]', re.IGNORECASE),
-            re.compile(r'financial\s*statements', re.IGNORECASE),
-            re.compile(r'supplementary\s*data', re.IGNORECASE),
-        ]
-
-        return self._matchscore_(repats, weights, htmltag)
+        return self._matchscore_(ITEMEIGHT_PATS, weights, htmltag)
 
     def _extractanchor_(self, atag):
         '''
@@ -157,13 +268,9 @@ class TENKPARSER:
             self.itemanchor[item] = tmpanchors
 
         self.logger.info('saving item anchor to $workdir...')
-        with open(f'{self.workdir}/itemanchor.dict.pickle', 'wb') as fp:
-            pickle.dump(self.itemanchor, fp)
+        self._savework_('itemanchor.dict.pickle', self.itemanchor)
         
-        if checkmessage:
-            self.logger.warning('please check item anchor manually... check messages have been saved in $workdir...')
-            with open(f'{self.workdir}/CHECK_ITEM_ANCHOR.LOG', 'w') as fp:
-                fp.write(checkmessage)
+        self._savecheck_('CHECK_ITEM_ANCHOR.LOG', checkmessage, 'item anchor')
 
     def _findanchortag_(self):
         '''
@@ -178,10 +285,8 @@ class TENKPARSER:
                 continue
             anchor_id = self.itemanchor[item][0]
             ### searching for name first
-            nametags = self.soup.find_all(attrs={'name':anchor_id})
-            nametags = [i.__str__() for i in nametags]
-            idtags = self.soup.find_all(attrs={'id':anchor_id})
-            idtags = [i.__str__() for i in idtags]
+            nametags = self._findattrtags_('name', anchor_id)
+            idtags = self._findattrtags_('id', anchor_id)
             ### tmptags
             tmptags = []
             tmptags.extend(nametags); tmptags.extend(idtags)
@@ -190,13 +295,9 @@ class TENKPARSER:
             self.anchortag[item].extend(tmptags)
 
         self.logger.info('saving item anchor tag to $workdir...')
-        with open(f'{self.workdir}/itemanchortag.dict.pickle', 'wb') as fp:
-            pickle.dump(self.anchortag, fp)
+        self._savework_('itemanchortag.dict.pickle', self.anchortag)
         
-        if checkmessage:
-            self.logger.warning('please check anchor tags manually... check messages have been saved in $workdir...')
-            with open(f'{self.workdir}/CHECK_ITEM_ANCHOR_TAG.LOG', 'w') as fp:
-                fp.write(checkmessage)
+        self._savecheck_('CHECK_ITEM_ANCHOR_TAG.LOG', checkmessage, 'anchor tags')
 
     def _findanchoridx_(self):
         '''
@@ -205,6 +306,7 @@ class TENKPARSER:
         self.logger.info('finding index for given anchors in different sections...')
         checkmessage = ''
         self.anchoridx = {}
+        htmlstr = self._htmlstr_()
         for item in self.anchortag:
             ### finding index for a given anchor
             if len(self.anchortag[item]) == 0:
@@ -214,33 +316,118 @@ class TENKPARSER:
             elif len(self.anchortag[item]) > 1:
                 checkmessage += f'{item},'
 
-            idx = self.soup.__str__().find(self.anchortag[item][0])
+            idx = htmlstr.find(self.anchortag[item][0])
             if idx == -1:
                 checkmessage += f'{item}_find,'
             else:
                 self.anchoridx[item] = idx
 
         self.logger.info('saving item anchor index to $workdir...')
-        with open(f'{self.workdir}/itemanchorindex.dict.pickle', 'wb') as fp:
-            pickle.dump(self.anchoridx, fp)
+        self._savework_('itemanchorindex.dict.pickle', self.anchoridx)
         
-        if checkmessage:
-            self.logger.warning('please check anchor indexes manually... check messages have been saved in $workdir...')
-            with open(f'{self.workdir}/CHECK_ITEM_ANCHOR_INDEX.LOG', 'w') as fp:
-                fp.write(checkmessage)
-            
+        self._savecheck_('CHECK_ITEM_ANCHOR_INDEX.LOG', checkmessage, 'anchor indexes')
 
+    def _findsectionoffset_(self):
+        '''
+        find byte ranges of items in the original html file, from self.itemanchor
 
-        
+        the file is memory mapped and scanned once for tags whose name/id is one of the anchors,
+        an item starts at its anchor tag and ends at the next anchor of any item, requested or not
+        (e.g. item 8 ends at item 9), or the end of the file
+        '''
+        self.logger.info('finding byte offsets of item anchors in the html file...')
+        checkmessage = ''
+        anchoritem = {}
+        for item in self.itemanchor:
+            if len(self.itemanchor[item]) == 0:
+                checkmessage += f'{item},'
+                continue
+            anchoritem.setdefault(self.itemanchor[item][0].encode(), []).append(item)
+        ### anchors of items not requested, only used as section ends
+        boundanchors = set()
+        for atags in getattr(self, 'boundtagmatch', {}).values():
+            boundanchors.update(self._extractanchor_(atag).encode() for atag in atags)
+        boundanchors = [anchor for anchor in boundanchors if anchor and anchor not in anchoritem]
 
+        self.sectionoffset = {}
+        starts = {}
+        with _mapfile_(self.htmlpath) as mm:
+            filesize = len(mm)
+            if anchoritem:
+                anchorpat = re.compile(
+                    rb'<[^<>]*?\b(?:id|name)\s*=\s*["\']?('
+                    + b'|'.join(re.escape(anchor) for anchor in list(anchoritem) + boundanchors)
+                    + rb')(?=["\'\s/>])',
+                    re.IGNORECASE,
+                )
+                for match in anchorpat.finditer(mm):
+                    anchor = match.group(1)
+                    if anchor not in starts:
+                        starts[anchor] = match.start()
+                        if len(starts) == len(anchoritem) + len(boundanchors):
+                            break
 
+        for anchor, items in anchoritem.items():
+            if anchor not in starts:
+                checkmessage += ''.join(f'{item}_find,' for item in items)
+        ### each section ends where the next one starts
+        bounds = sorted(set(starts.values())) + [filesize]
+        for anchor, start in starts.items():
+            if anchor not in anchoritem:
+                continue
+            end = bounds[bounds.index(start) + 1]
+            for item in anchoritem[anchor]:
+                self.sectionoffset[item] = (start, end)
 
+        self.logger.info('saving item section offsets to $workdir...')
+        self._savework_('itemsectionoffset.dict.pickle', self.sectionoffset)
 
-    
+        self._savecheck_('CHECK_ITEM_SECTION_OFFSET.LOG', checkmessage, 'section offsets')
 
-        
+    def _results_(self):
+        '''
+        results of all stages as a dictionary (anchors, anchor tags, indexes, section offsets and check messages)
+        '''
+        return {
+            'itemanchor': getattr(self, 'itemanchor', {}),
+            'anchortag': getattr(self, 'anchortag', {}),
+            'anchoridx': getattr(self, 'anchoridx', {}),
+            'sectionoffset': getattr(self, 'sectionoffset', {}),
+            'checks': dict(self.checks),
+        }
 
+    def _sectionbytes_(self, item):
+        '''
+        raw html bytes of an item, only the section is read from the memory mapped file
+        '''
+        start, end = self.sectionoffset[item]
+        with _mapfile_(self.htmlpath) as mm:
+            return mm[start:end]
 
+    def _extractsection_(self, item, txtpath=None, encoding='utf-8', compress=None):
+        '''
+        extract plain text of an item (e.g. `I7`) from its byte range, save it to `txtpath` if given
+        (`Item7.txt` used by textanalysis/matching_edgar.py), compressed with `compress` (`gzip`/`zstd`) if given
+        '''
+        self.logger.info(f'extracting text of {item}...')
+        text = _htmltotext_(self._sectionbytes_(item), encoding)
+        if txtpath is not None:
+            with open(txtpath, 'wb') as rawfp, _compresswriter_(rawfp, compress) as fp:
+                fp.write(text.encode('utf-8'))
+        return text
 
+    def _extracttables_(self, item='I8', encoding='utf-8'):
+        '''
+        extract all tables of an item (Item 8 by default) from its byte range as numeric cells,
+        see tableparser.py; saved to $workdir/item*tables.pickle
 
-        
\ No newline at end of file
+        Returns:
+        ----------
+        pd.DataFrame, one row per cell with table, row, col, text, scale, th, value, header and scaled
+        '''
+        self.logger.info(f'extracting tables of {item}...')
+        self.tables = _numericcells_(_tablecells_(self._sectionbytes_(item), encoding))
+        self._savework_(f'{item.lower()}tables.pickle', self.tables)
+        if len(self.tables) == 0:
+            self._savecheck_('CHECK_ITEM_TABLES.LOG', f'no table found in {item}...', 'item tables')
+        return self.tables
@@ -0,0 +1,75 @@
+### scoring html tags against 10-k items in a single pass
+import re
+
+### item -> list of (pattern, weight), patterns are matched case-insensitively
+ITEM_PATTERNS = {
+    'I1': [(r'item\s*1(?![0-9A-Z])', 3), (r'business', 1)],
+    'I1A': [(r'item\s*1A', 3), (r'risk\s*factors', 1)],
+    'I1B': [(r'item\s*1B', 3), (r'unresolved\s*staff\s*comments', 1)],
+    'I2': [(r'item\s*2(?![0-9A-Z])', 3), (r'properties', 1)],
+    'I3': [(r'item\s*3(?![0-9A-Z])', 3), (r'legal\s*proceedings', 1)],
+    'I4': [(r'item\s*4(?![0-9A-Z])', 3), (r'mine\s*safety\s*disclosures', 1), (r'submission\s*of\s*matters', 1)],
+    'I5': [(r'item\s*5(?![0-9A-Z])', 3), (r'market\s*for\s*(?:the\s*)?registrant', 1), (r'equity\s*securities', 1)],
+    'I6': [(r'item\s*6(?![0-9A-Z])', 3), (r'selected\s*financial\s*data', 1)],
+    'I7': [(r'item\s*7(?![0-9A-Z])', 3), (r'discussion\s*and\s*analysis', 1), (r'financial\s*condition', 1)],
+    'I7A': [(r'item\s*7A', 3), (r'quantitative\s*and\s*qualitative\s*disclosures', 1), (r'market\s*risk', 1)],
+    'I8': [(r'item\s*8(?![0-9A-Z])', 3), (r'financial\s*statements', 1), (r'supplementary\s*data', 1)],
+    'I9': [(r'item\s*9(?![0-9A-Z])', 3), (r'changes\s*in\s*and\s*disagreements', 1)],
+    'I9A': [(r'item\s*9A', 3), (r'controls\s*and\s*procedures', 1)],
+    'I9B': [(r'item\s*9B', 3), (r'other\s*information', 1)],
+    'I10': [(r'item\s*10(?![0-9A-Z])', 3), (r'directors,?\s*executive\s*officers', 1)],
+    'I11': [(r'item\s*11(?![0-9A-Z])', 3), (r'executive\s*compensation', 1)],
+    'I12': [(r'item\s*12(?![0-9A-Z])', 3), (r'security\s*ownership', 1)],
+    'I13': [(r'item\s*13(?![0-9A-Z])', 3), (r'certain\s*relationships', 1), (r'director\s*independence', 1)],
+    'I14': [(r'item\s*14(?![0-9A-Z])', 3), (r'principal\s*account\w*\s*fees', 1)],
+    'I15': [(r'item\s*15(?![0-9A-Z])', 3), (r'exhibits', 1), (r'financial\s*statement\s*schedules', 1)],
+}
+
+class ITEMSCORER:
+    '''
+    Object for scoring a string against all 10-k items at once
+
+    all patterns are compiled into one regular expression, so each string is scanned a single time;
+    the score of an item is the sum of weights of its patterns found in the string (each pattern counted once)
+
+    Params:
+    ----------
+    itempatterns: dict
+        item -> list of (pattern, weight), ITEM_PATTERNS by default
+    '''
+    def __init__(self, itempatterns=None):
+        if itempatterns is None:
+            itempatterns = ITEM_PATTERNS
+        self.items = list(itempatterns)
+        ### the same pattern may be shared by several items
+        patterns = []
+        self.groupweights = {}
+        for item, repats in itempatterns.items():
+            for repat, weight in repats:
+                if repat not in patterns:
+                    patterns.append(repat)
+                group = f'p{patterns.index(repat)}'
+                self.groupweights.setdefault(group, []).append((item, weight))
+        self.pattern = re.compile(
+            '|'.join(f'(?P<p{i}>{repat})' for i, repat in enumerate(patterns)),
+            re.IGNORECASE,
+        )
+
+    def _score_(self, htmltag):
+        '''
+        score a string (or html tag) against all items
+
+        Returns:
+        ----------
+        dict, item -> score
+        '''
+        if not isinstance(htmltag, str):
+            htmltag = htmltag.__str__()
+        scores = dict.fromkeys(self.items, 0)
+        matched = set(match.lastgroup for match in self.pattern.finditer(htmltag))
+        for group in matched:
+            for item, weight in self.groupweights[group]:
+                scores[item] += weight
+        return scores
+
+DEFAULT_SCORER = ITEMSCORER()
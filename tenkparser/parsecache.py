@@ -0,0 +1,120 @@
+### caching TENKPARSER results by file content
+from edgarparser import TENKPARSER, PARSER_VERSION
+from itemscorer import DEFAULT_SCORER
+from threading import Lock
+from time import time
+import hashlib
+import logging
+import sqlite3
+import pickle
+
+def _filehash_(htmlpath, chunksize=1<<20):
+    '''sha256 of the file content'''
+    sha = hashlib.sha256()
+    with open(htmlpath, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(chunksize), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _fingerprint_(backend='lxml', items=('I7', 'I7A', 'I8'), scorethreshold=1, scorer=None):
+    '''
+    fingerprint of everything that changes the parsing results besides the file itself
+    '''
+    if scorer is None:
+        scorer = DEFAULT_SCORER
+    config = repr((PARSER_VERSION, backend, tuple(items), scorethreshold, scorer.pattern.pattern, sorted(scorer.groupweights.items())))
+    return hashlib.sha256(config.encode()).hexdigest()[:16]
+
+class PARSECACHE:
+    '''
+    object for caching TENKPARSER results, keyed by file content hash and parser fingerprint
+
+    results are kept in a sqlite database, the least recently used ones are evicted
+    once the total size goes above `maxbytes`
+
+    Initialize the object
+    Params:
+    ----------
+    cachefname: str
+        path for the sqlite file, created if it does not exist
+    maxbytes: int
+        size budget for all cached results
+    '''
+    def __init__(
+        self,
+        cachefname,
+        maxbytes=1<<30,
+        ):
+        self.logger = logging.getLogger('edgar.tenk')
+        self.cachefname = cachefname
+        self.maxbytes = maxbytes
+        self.lock = Lock()
+        self.conn = sqlite3.connect(self.cachefname, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, value BLOB, size INTEGER, lastused REAL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS results_lastused ON results (lastused)')
+        self.conn.commit()
+
+    def _get_(self, key):
+        '''return cached results for `key`, None if not cached'''
+        with self.lock, self.conn:
+            record = self.conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if record is None:
+                return None
+            self.conn.execute('UPDATE results SET lastused = ? WHERE key = ?', (time(), key))
+        return pickle.loads(record[0])
+
+    def _put_(self, key, results):
+        '''cache `results` for `key` and evict old results beyond the size budget'''
+        value = pickle.dumps(results)
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                (key, value, len(value), time()),
+            )
+            total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+            if total <= self.maxbytes:
+                return
+            ### drop the least recently used results until the cache fits
+            evict = []
+            for oldkey, size in self.conn.execute('SELECT key, size FROM results ORDER BY lastused'):
+                if total <= self.maxbytes:
+                    break
+                if oldkey == key:
+                    continue
+                evict.append((oldkey,)); total -= size
+            self.conn.executemany('DELETE FROM results WHERE key = ?', evict)
+            self.logger.info(f'{len(evict)} cached results evicted...')
+
+    def _close_(self):
+        '''close the cache'''
+        with self.lock:
+            self.conn.close()
+
+def _parse_cached_(htmlpath, cache=None, backend='lxml', items=('I7', 'I7A', 'I8'), scorethreshold=1, scorer=None):
+    '''
+    run all TENKPARSER stages on a file, or return the cached results if the file has been parsed
+    with the same configuration before
+
+    Returns:
+    ----------
+    dict, see TENKPARSER._results_
+    '''
+    if cache is not None:
+        key = '{}:{}'.format(_filehash_(htmlpath), _fingerprint_(backend, items, scorethreshold, scorer))
+        results = cache._get_(key)
+        if results is not None:
+            return results
+    parser = TENKPARSER(htmlpath, None, backend=backend, scorer=scorer)
+    parser._finditemhref_(scorethreshold, items)
+    parser._finditemanchor_()
+    parser._findanchortag_()
+    parser._findanchoridx_()
+    parser._findsectionoffset_()
+    results = parser._results_()
+    if cache is not None:
+        cache._put_(key, results)
+    return results
@@ -0,0 +1,166 @@
+### packing item section texts of many filings into one file
+from threading import Lock
+from utils import _openfile_
+import pandas as pd
+import argparse
+import logging
+import sqlite3
+import fcntl
+import mmap
+import os
+
+class SECTIONSTORE:
+    '''
+    object for keeping item section texts of all filings in one append-only file
+
+    texts are appended to `$storedir/sections.dat` (utf-8), and a sqlite index `$storedir/sections.sqlite`
+    keeps the (offset, length) of each (cik, accession, item); readers get slices of the memory mapped file.
+    Adding a section again appends the new text and points the index to it
+
+    Initialize the object
+    Params:
+    ----------
+    storedir: str
+        directory for the store, created if it does not exist
+    '''
+    def __init__(
+        self,
+        storedir,
+        ):
+        self.logger = logging.getLogger('edgar.tenk')
+        self.storedir = storedir
+        os.makedirs(self.storedir, exist_ok=True)
+        self.datafname = f'{self.storedir}/sections.dat'
+        self.lock = Lock()
+        self.conn = sqlite3.connect(f'{self.storedir}/sections.sqlite', timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS sections ('
+            'cik INTEGER, accession TEXT, item TEXT, offset INTEGER, length INTEGER, '
+            'PRIMARY KEY (cik, accession, item))'
+        )
+        self.conn.commit()
+        open(self.datafname, 'ab').close()
+        self.mm = None
+
+    def _add_(self, cik, accession, item, text):
+        '''
+        append the text (str or bytes) of a section and index it under (cik, accession, item)
+        '''
+        data = text.encode('utf-8') if isinstance(text, str) else bytes(text)
+        with self.lock, open(self.datafname, 'ab') as fp:
+            ### other processes may append to the same store
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                offset = fp.seek(0, os.SEEK_END)
+                fp.write(data); fp.flush()
+                with self.conn:
+                    self.conn.execute(
+                        'INSERT OR REPLACE INTO sections VALUES (?, ?, ?, ?, ?)',
+                        (int(cik), str(accession), item, offset, len(data)),
+                    )
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def _mmap_(self, end):
+        '''map the data file, again if it has grown beyond the current map'''
+        if end == 0 and self.mm is None:
+            ### an empty file cannot be mapped, only empty sections are stored
+            return b''
+        if self.mm is None or end > len(self.mm):
+            ### the old map is not closed here, slices given out earlier may still use it
+            with open(self.datafname, 'rb') as fp:
+                self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.mm
+
+    def _get_(self, cik, accession, item):
+        '''
+        utf-8 bytes of a section as a memoryview of the memory mapped file (no copy), None if not in the store
+        '''
+        with self.lock:
+            record = self.conn.execute(
+                'SELECT offset, length FROM sections WHERE cik = ? AND accession = ? AND item = ?',
+                (int(cik), str(accession), item),
+            ).fetchone()
+            if record is None:
+                return None
+            offset, length = record
+            if length == 0:
+                return memoryview(b'')
+            return memoryview(self._mmap_(offset + length))[offset:offset + length]
+
+    def _text_(self, cik, accession, item):
+        '''text of a section, None if not in the store'''
+        data = self._get_(cik, accession, item)
+        return None if data is None else str(data, 'utf-8')
+
+    def _keys_(self, item=None):
+        '''
+        index of the store as a DataFrame with columns cik, accession, item, offset and length
+        '''
+        query = 'SELECT cik, accession, item, offset, length FROM sections'
+        params = []
+        if item is not None:
+            query += ' WHERE item = ?'; params.append(item)
+        with self.lock:
+            return pd.read_sql_query(query + ' ORDER BY offset', self.conn, params=params)
+
+    def _iter_sections_(self, item=None):
+        '''
+        yield (cik, accession, item, text) in the order of the data file (sequential reads)
+        '''
+        keys = self._keys_(item)
+        if len(keys) == 0:
+            return
+        mm = self._mmap_(int((keys['offset'] + keys['length']).max()))
+        for cik, accession, sectionitem, offset, length in keys.itertuples(index=False):
+            yield cik, accession, sectionitem, str(mm[offset:offset + length], 'utf-8')
+
+    def _import_folders_(self, folderdf, item='I7', txtname='Item7.txt', foldercol='itemseven_folder'):
+        '''
+        import section texts from the one-folder-per-filing layout (e.g. `$itemseven_folder/Item7.txt`)
+
+        Params:
+        ----------
+        folderdf: pd.DataFrame
+            with columns cik, accession and `foldercol`
+        item: str
+            item key in the store
+        txtname: str
+            name of the text file in each folder
+
+        Returns:
+        ----------
+        number of sections imported
+        '''
+        count = 0
+        for cik, accession, folder in zip(folderdf['cik'], folderdf['accession'], folderdf[foldercol]):
+            txtpath = f'{folder}/{txtname}'
+            if not os.path.exists(txtpath):
+                self.logger.warning(f'{txtpath} not found...')
+                continue
+            with _openfile_(txtpath, 'rb') as fp:
+                self._add_(cik, accession, item, fp.read())
+            count += 1
+        self.logger.info(f'{count} sections imported to {self.storedir}...')
+        return count
+
+    def _close_(self):
+        '''close the store'''
+        with self.lock:
+            self.mm = None
+            self.conn.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import item section texts from folders into a SECTIONSTORE')
+    parser.add_argument('folders', type=str, help='Pickle with columns cik, accession and itemseven_folder')
+    parser.add_argument('storedir', type=str, help='Directory of the store')
+    parser.add_argument('--item', type=str, default='I7', help='Item key in the store')
+    parser.add_argument('--txtname', type=str, default='Item7.txt', help='Name of the text file in each folder')
+
+    args = parser.parse_args()
+
+    store = SECTIONSTORE(args.storedir)
+    count = store._import_folders_(pd.read_pickle(args.folders), args.item, args.txtname)
+    store._close_()
+    print(f'[info] {count} sections imported')
@@ -0,0 +1,117 @@
+### splitting full SGML submission .txt files into documents
+from utils import _openfile_
+import argparse
+import logging
+import glob
+import os
+import re
+
+TENK_TYPES = ('10-K', '10-K405', '10-KSB', '10-K/A')
+### header tags of a <DOCUMENT>, before <TEXT>
+DOCUMENT_HEADER = re.compile(rb'<(TYPE|SEQUENCE|FILENAME|DESCRIPTION)>([^\r\n]*)')
+UUENCODE_BEGIN = re.compile(rb'begin [0-7]{3,4} ')
+
+def _iter_lines_(fp, maxline=1<<20):
+    '''
+    read a binary file line by line, lines longer than `maxline` are returned in pieces
+
+    Yields:
+    ----------
+    (bool, bytes) - whether the piece starts a line, and the piece itself
+    '''
+    linestart = True
+    while True:
+        piece = fp.readline(maxline)
+        if not piece:
+            return
+        yield linestart, piece
+        linestart = piece.endswith(b'\n')
+
+def _split_submission_(txtpath, outdir, types=TENK_TYPES, maxline=1<<20):
+    '''
+    scan a full submission .txt file once and save the body of documents in `types`
+
+    the file is read line by line (at most `maxline` bytes at a time), documents of other types
+    are skipped without being kept, and uuencoded blocks (images, pdfs, ...) are skipped without decoding
+
+    Params:
+    ----------
+    txtpath: str
+        path for the submission file
+    outdir: str
+        directory for saving the documents, as `<sequence>-<filename>`
+    types: tuple or None
+        document types to keep, None for all documents
+
+    Yields:
+    ----------
+    dict with type, sequence, filename, description, path, bytes and uuencoded (number of blocks skipped)
+    '''
+    logger = logging.getLogger('edgar.tenk')
+    types = None if types is None else set(types)
+    document = None; outfp = None
+    inheader = intext = inuuencode = False
+
+    with _openfile_(txtpath, 'rb') as fp:
+        for linestart, line in _iter_lines_(fp, maxline):
+            ### markers only count at the start of a line
+            marker = line.strip() if linestart and line[:1] == b'<' else b''
+            if marker == b'<DOCUMENT>':
+                document = {'type': '', 'sequence': '', 'filename': '', 'description': '', 'path': None, 'bytes': 0, 'uuencoded': 0}
+                inheader = True; intext = inuuencode = False
+                continue
+            if document is None:
+                continue
+            if marker == b'</DOCUMENT>':
+                if outfp is not None:
+                    outfp.close(); outfp = None
+                    yield document
+                document = None
+                continue
+            if inheader:
+                if marker == b'<TEXT>':
+                    inheader = False; intext = True
+                    if types is None or document['type'] in types:
+                        fname = document['filename'] or f"{document['type'].replace('/', '')}.txt"
+                        document['path'] = f"{outdir}/{document['sequence'] or 0}-{os.path.basename(fname)}"
+                        os.makedirs(outdir, exist_ok=True)
+                        outfp = open(document['path'], 'wb')
+                    continue
+                match = DOCUMENT_HEADER.match(line) if linestart else None
+                if match is not None:
+                    document[match.group(1).decode().lower()] = match.group(2).decode('latin-1').strip()
+                continue
+            if not intext or outfp is None:
+                continue
+            if marker == b'</TEXT>':
+                intext = False
+                continue
+            ### uuencoded block, from `begin 644 name` to `end`
+            if linestart and not inuuencode and UUENCODE_BEGIN.match(line):
+                inuuencode = True; document['uuencoded'] += 1
+                continue
+            if inuuencode:
+                if linestart and line.strip() == b'end':
+                    inuuencode = False
+                continue
+            outfp.write(line)
+            document['bytes'] += len(line)
+
+    if outfp is not None:
+        ### no </DOCUMENT> at the end of the file
+        outfp.close()
+        logger.warning(f'{txtpath} ends inside a document...')
+        yield document
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Split full submission .txt files into documents')
+    parser.add_argument('pattern', type=str, help='Glob pattern for submission files (quote it), e.g. "data/**/*.txt"')
+    parser.add_argument('outdir', type=str, help='Directory for saving documents, as <outdir>/<submission name>/<sequence>-<filename>')
+    parser.add_argument('--types', type=str, nargs='+', default=list(TENK_TYPES), help='Document types to keep')
+
+    args = parser.parse_args()
+
+    for txtpath in sorted(glob.glob(args.pattern, recursive=True)):
+        submission = os.path.splitext(os.path.basename(txtpath))[0]
+        for document in _split_submission_(txtpath, f'{args.outdir}/{submission}', args.types):
+            print('[info] {} - {} ({} bytes) saved to {}'.format(txtpath, document['type'], document['bytes'], document['path']))
@@ -0,0 +1,147 @@
+### extracting financial tables from an item section into typed arrays
+import lxml.html
+import pandas as pd
+import numpy as np
+import re
+
+### one pattern for a numeric cell: `$ (1,234.5)(1)`, `-56`, `789 *`, `12.5%`, ...
+NUMBER_CELL = (
+    r'^\$?\s*(?P<paren>\()?\s*(?P<minus>[-−])?\s*\$?\s*'
+    r'(?P<number>\d[\d,]*(?:\.\d+)?|\.\d+)'
+    r'\s*\)?\s*%?\s*(?:\(\s*(?:\d{1,2}|[a-zA-Z])\s*\)|\*+)*$'
+)
+### cells meaning zero / nil
+DASH_CELL = r'^[-‒–—―−]+$'
+### cells carrying no value, e.g. the `$` or `)` split from a number
+FILLER_CELL = r'^[\s$)%]*$'
+### footnote markers in a cell of their own, `(a)`, `*` (a lone `(12)` is a negative number)
+MARKER_CELL = r'^(?:\(\s*[a-zA-Z]\s*\)|\*+)$'
+### column headers such as `2019`
+YEAR_CELL = r'^(?:19|20)\d{2}$'
+SCALE_HINT = re.compile(r'in\s+(thousands|millions|billions)', re.IGNORECASE)
+SCALES = {'thousands': 1e3, 'millions': 1e6, 'billions': 1e9}
+
+def _scalehint_(text):
+    '''scale factor from a hint like `(in thousands)` in `text`, 1 if there is none'''
+    match = SCALE_HINT.search(text)
+    return 1.0 if match is None else SCALES[match.group(1).lower()]
+
+def _tablecells_(htmlbytes, encoding='utf-8', hintchars=500):
+    '''
+    gather the cells of all tables in an html fragment (bytes)
+
+    the scale hint of a table is looked for in the table itself and in the text of at most
+    `hintchars` characters before it
+
+    Returns:
+    ----------
+    pd.DataFrame in long format, one row per cell, with columns table, row, col, text, scale
+    and th (whether the cell is a `<th>`)
+    '''
+    columns = ['table', 'row', 'col', 'text', 'scale', 'th']
+    if not htmlbytes.strip():
+        return pd.DataFrame(columns=columns)
+    root = lxml.html.fragment_fromstring(htmlbytes.decode(encoding, errors='replace'), create_parent='div')
+
+    tables = []; rows = []; cols = []; texts = []; scales = []; ths = []
+    for tableidx, table in enumerate(root.iter('table')):
+        before = []; nchars = 0
+        for sibling in table.itersiblings(preceding=True):
+            if sibling.tag == 'table' or nchars > hintchars:
+                break
+            before.append(sibling.text_content()); nchars += len(before[-1])
+        tabletext = table.text_content()
+        scale = _scalehint_(tabletext)
+        if scale == 1.0:
+            scale = _scalehint_(' '.join(before))
+
+        for rowidx, tr in enumerate(table.iter('tr')):
+            colidx = 0
+            for cell in tr:
+                if cell.tag not in ('td', 'th'):
+                    continue
+                tables.append(tableidx); rows.append(rowidx); cols.append(colidx)
+                texts.append(cell.text_content()); scales.append(scale); ths.append(cell.tag == 'th')
+                span = cell.get('colspan', '1').strip()
+                colidx += int(span) if span.isdigit() else 1
+
+    return pd.DataFrame({
+        'table': np.array(tables, dtype=np.int32),
+        'row': np.array(rows, dtype=np.int32),
+        'col': np.array(cols, dtype=np.int32),
+        'text': texts,
+        'scale': np.array(scales, dtype=np.float64),
+        'th': np.array(ths, dtype=bool),
+    }, columns=columns)
+
+def _parsenumbers_(texts):
+    '''
+    convert cell texts into numbers in one vectorized pass
+
+    parenthesized or minus-signed numbers are negative, thousands separators, `$`, `%` and footnote markers
+    (`(1)`, `(a)`, `*`) after a number are dropped, dashes are zero, other texts and markers on their own
+    (`(a)`, `*`) are NaN
+
+    Params:
+    ----------
+    texts: pd.Series of str
+
+    Returns:
+    ----------
+    pd.Series of float64
+    '''
+    texts = texts.astype(str).str.replace('\xa0', ' ', regex=False).str.strip()
+    parts = texts.str.extract(NUMBER_CELL)
+    values = pd.to_numeric(parts['number'].str.replace(',', '', regex=False), errors='coerce')
+    negative = parts['paren'].notna() | parts['minus'].notna()
+    values = values.where(~negative, -values)
+    values = values.mask(texts.str.match(DASH_CELL), 0.0)
+    values = values.mask(texts.str.match(MARKER_CELL))
+    return values.astype(np.float64)
+
+def _numericcells_(cells):
+    '''
+    add `value` (as printed) and `scaled` (value times the scale hint) to the cells from `_tablecells_`,
+    and drop filler cells (empty, `$`, `)`) and footnote markers on their own
+
+    header rows (with a `<th>` cell, or whose numbers are all years, e.g. `2019 2018` above the columns)
+    are flagged in `header` and not scaled (`scaled` is NaN)
+
+    cells of many filings can be concatenated first and converted at once
+    '''
+    texts = cells['text'].astype(str).str.replace('\xa0', ' ', regex=False).str.strip()
+    cells = cells[~(texts.str.match(FILLER_CELL) | texts.str.match(MARKER_CELL))].copy()
+    cells['value'] = _parsenumbers_(cells['text'])
+    ### rows are consecutive runs of (table, row), also across concatenated filings
+    rowkey = ((cells['table'] != cells['table'].shift()) | (cells['row'] != cells['row'].shift())).cumsum()
+    isnumber = cells['value'].notna()
+    isyear = isnumber & cells['text'].astype(str).str.strip().str.match(YEAR_CELL)
+    numbers = isnumber.groupby(rowkey).transform('sum')
+    years = isyear.groupby(rowkey).transform('sum')
+    hasth = cells['th'].groupby(rowkey).transform('any') if 'th' in cells else False
+    cells['header'] = hasth | ((numbers > 0) & (years == numbers))
+    cells['scaled'] = (cells['value'] * cells['scale']).mask(cells['header'])
+    return cells.reset_index(drop=True)
+
+def _tablearray_(cells, table, scaled=True):
+    '''
+    one table as a wide DataFrame: the row label (first non-numeric cell) as the index
+    and the numeric columns (in order) as float64 columns
+
+    Params:
+    ----------
+    cells: pd.DataFrame
+        output of `_numericcells_`
+    table: int
+        table index
+    scaled: bool
+        use scaled values
+    '''
+    cells = cells[cells['table'] == table]
+    isnumber = cells['value'].notna()
+    labels = cells[~isnumber].groupby('row')['text'].first().str.strip()
+    numbers = cells[isnumber]
+    wide = numbers.pivot_table(index='row', columns='col', values='scaled' if scaled else 'value', aggfunc='first')
+    wide.columns = range(wide.shape[1])
+    wide.index = labels.reindex(wide.index).fillna('').values
+    return wide
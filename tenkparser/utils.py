@@ -1,4 +1,13 @@
+import contextlib
 import logging
+import gzip
+import mmap
+import io
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 def _setlogger_(
     module='main',
@@ -26,3 +35,73 @@ def _setlogger_(
     file.setLevel(filelevel)
     file.setFormatter(formatter)
     logger.addHandler(file)
+
+### compressed files are recognized by their first bytes
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+def _detectcodec_(fname):
+    '''
+    codec of a file from its magic number, `gzip`, `zstd` or None for uncompressed files
+    '''
+    with open(fname, 'rb') as fp:
+        head = fp.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return None
+
+def _openfile_(fname, mode='rb', encoding=None):
+    '''
+    open a file for reading, gzip/zstd compressed files are decompressed on the fly
+
+    Params:
+    ----------
+    fname: str
+    mode: str
+        `rb` for bytes, `r`/`rt` for text
+    encoding: str or None
+        encoding for the text mode, the default encoding of `open` if None
+    '''
+    codec = _detectcodec_(fname)
+    if codec is None:
+        return open(fname, mode, encoding=None if 'b' in mode else encoding)
+    if codec == 'gzip':
+        fp = gzip.open(fname, 'rb')
+    else:
+        if zstandard is None:
+            raise ImportError(f'{fname} is zstd compressed but zstandard is not installed... Aborted...')
+        fp = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(fname, 'rb'), closefd=True))
+    if 'b' in mode:
+        return fp
+    return io.TextIOWrapper(fp, encoding=encoding)
+
+def _compresswriter_(fp, codec=None):
+    '''
+    wrap a binary file object opened for writing, so that everything written to it is compressed with `codec`
+    (`gzip`, `zstd` or None for no compression); closing the wrapper does not close `fp`
+    '''
+    if codec is None:
+        return contextlib.nullcontext(fp)
+    if codec == 'gzip':
+        ### no file name or time in the header, the same content always gives the same bytes
+        return gzip.GzipFile(filename='', fileobj=fp, mode='wb', compresslevel=6, mtime=0)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ImportError('zstandard is not installed, use `gzip` instead... Aborted...')
+        return zstandard.ZstdCompressor(level=3).stream_writer(fp, closefd=False)
+    raise ValueError(f'codec should be `gzip`, `zstd` or None, but {codec} given... Aborted...')
+
+@contextlib.contextmanager
+def _mapfile_(fname):
+    '''
+    content of a file as a read-only memory map, or as bytes if the file is compressed
+    (offsets are always offsets in the uncompressed content)
+    '''
+    if _detectcodec_(fname) is not None:
+        with _openfile_(fname, 'rb') as fp:
+            yield fp.read()
+        return
+    with open(fname, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield mm
@@ -0,0 +1,125 @@
+### matching keywords over a corpus of item texts with a process pool
+from matching_edgar import _RekeywordsMatcher, _MatchSentenceKeywords
+from utils import _openfile_
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import pyarrow.parquet as pq
+import pyarrow as pa
+import pandas as pd
+import argparse
+
+SENTENCE_SCHEMA = pa.schema([
+    ('fileidx', pa.string()),
+    ('sentence', pa.string()),
+    ('keyword', pa.string()),
+    ('start', pa.int64()),
+    ('end', pa.int64()),
+])
+
+_matcher = None
+
+def _read_keywords(keywordfname):
+    '''
+    Read a keyword list, one keyword per line
+    '''
+    with open(keywordfname) as fp:
+        return [line.strip() for line in fp if line.strip()]
+
+def _init_worker(keywords):
+    '''
+    compile the keywords once per worker process
+    '''
+    global _matcher
+    _matcher = _RekeywordsMatcher(keywords)
+
+def _match_one(job):
+    '''
+    match sentences of one text file
+
+    Parameters:
+    ------------
+    job: (fileidx, txtpath)
+
+    Returns:
+    ------------
+    (status row, pd.DataFrame of matches - one row per (sentence, keyword))
+    '''
+    fileidx, txtpath = job
+    status = {'fileidx': fileidx, 'sentence_count': -1, 'match_count': 0, 'note': '', 'seconds': 0.0}
+    start = perf_counter()
+    matches = None
+    try:
+        with _openfile_(txtpath, 'r', encoding='utf-8') as fp:
+            content = fp.read()
+        sentences = _MatchSentenceKeywords(content, _matcher)
+        sentences['sentence'] = [content[s:e] for s, e in zip(sentences['start'], sentences['end'])]
+        matches = sentences.explode('keywords').rename(columns={'keywords': 'keyword'})
+        matches.insert(0, 'fileidx', str(fileidx))
+        status['sentence_count'] = len(sentences)
+        status['match_count'] = len(matches)
+    except Exception as Excpt:
+        status['note'] = repr(Excpt)
+    status['seconds'] = perf_counter() - start
+    return status, matches
+
+def _match_batch(matchingdf, keywords, sentencefname, statusfname, txtname='Item7.txt', maxworkers=None, chunksize=16, reportevery=1000):
+    '''
+    Match keywords in all files over a process pool, write all matched sentences into one parquet file
+
+    Parameters:
+    ------------
+    matchingdf: pd.DataFrame
+        with columns fileidx and itemseven_folder (e.g. Matching_Files.pickle)
+    keywords: list
+        keywords, see _RekeywordsMatcher
+    sentencefname: str
+        Path for the parquet file with columns fileidx, sentence, keyword, start and end (one row per keyword in a sentence)
+    statusfname: str
+        Path for saving matchingdf with sentence_count, match_count, note and seconds (pickle)
+    txtname: str
+        Name of the text file in each folder
+    maxworkers: int or None
+        Number of processes, all cores by default
+    chunksize: int
+        Number of files sent to a worker at once
+
+    Returns:
+    ------------
+    the status table
+    '''
+    jobs = list(zip(matchingdf['fileidx'], matchingdf['itemseven_folder'].astype(str) + '/' + txtname))
+    print(f'[info] matching {len(jobs)} files against {len(keywords)} keywords')
+
+    statuses = []
+    start = perf_counter()
+    with pq.ParquetWriter(sentencefname, SENTENCE_SCHEMA) as writer, \
+            ProcessPoolExecutor(max_workers=maxworkers, initializer=_init_worker, initargs=(keywords,)) as executor:
+        for status, matches in executor.map(_match_one, jobs, chunksize=chunksize):
+            statuses.append(status)
+            if matches is not None and len(matches) > 0:
+                writer.write_table(pa.Table.from_pandas(matches[SENTENCE_SCHEMA.names], schema=SENTENCE_SCHEMA, preserve_index=False))
+            if len(statuses) % reportevery == 0 or len(statuses) == len(jobs):
+                elapsed = perf_counter() - start
+                print('[info] {}/{} files matched - {:.1f} files/s'.format(len(statuses), len(jobs), len(statuses) / elapsed))
+
+    statusdf = pd.DataFrame(statuses)
+    statusdf = pd.concat([matchingdf.reset_index(drop=True), statusdf.drop(columns='fileidx')], axis=1)
+    statusdf.to_pickle(statusfname)
+    print('[info] {} files failed'.format((statusdf['sentence_count'] == -1).sum()))
+    return statusdf
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Match keywords in item texts over a process pool')
+    parser.add_argument('matching', type=str, help='Pickle with columns fileidx and itemseven_folder, e.g. Matching_Files.pickle')
+    parser.add_argument('keywords', type=str, help='Keyword list, one keyword per line')
+    parser.add_argument('--sentences', type=str, default='./sentences.parquet', help='Path for the matched sentences (parquet)')
+    parser.add_argument('--status', type=str, default='./Matching_status.pickle', help='Path for the status table (pickle)')
+    parser.add_argument('--txtname', type=str, default='Item7.txt', help='Name of the text file in each folder')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes, all cores by default')
+
+    args = parser.parse_args()
+
+    _match_batch(
+        pd.read_pickle(args.matching), _read_keywords(args.keywords),
+        args.sentences, args.status, args.txtname, args.workers
+    )
@@ -0,0 +1,151 @@
+### sparse document x keyword count matrices
+from matching_edgar import _RekeywordsMatcher, _SentenceSpans, _HitSentences
+from utils import _openfile_
+from scipy import sparse
+import pandas as pd
+import numpy as np
+import argparse
+
+def _KeywordMatrix(texts, keywords, level='document'):
+    '''
+    Count keywords in a corpus into a sparse matrix, in one pass over each text
+
+    keywords are matched as in _RekeywordsMatcher (case insensitive, flexible spaces between single words),
+    overlapping occurrences are all counted (`risk` is counted in `climate risk` too)
+
+    Parameters:
+    ------------
+    texts: iterable of str
+        one text per document (a filing, or a section of a filing)
+    keywords: list or _KeywordsTrie
+    level: str
+        `document` for a documents x keywords matrix, `sentence` for a sentences x keywords matrix
+        (only sentences containing keywords are kept)
+
+    Returns:
+    ------------
+    matrix: scipy.sparse.csr_matrix of int32
+    rows: pd.DataFrame - what each row is, columns doc (position in texts), and start, end for sentences
+        (leading spaces excluded, the same offsets as `_MatchSentenceKeywords`)
+    keywords: list
+    '''
+    matcher = _RekeywordsMatcher(keywords) if isinstance(keywords, (list, tuple)) else keywords
+    if level not in ('document', 'sentence'):
+        raise ValueError(f'unknown level {level}... Aborted...')
+
+    docs = []; sentenceends = []; columns = []
+    ndocs = 0; rows = []
+    for docidx, content in enumerate(texts):
+        ndocs += 1
+        positions, hitends, keywordidx = matcher._hitspans(content)
+        docs.append(np.full(len(keywordidx), docidx, dtype=np.int64)); columns.append(keywordidx)
+        if level == 'sentence':
+            starts, ends = _SentenceSpans(content)
+            ### sentences joined by keywords running over their ends, as in _MatchSentenceKeywords
+            hitsentence, spanstarts, spanends = _HitSentences(starts, ends, positions, hitends)
+            sentenceends.append(hitsentence)
+            ### leading spaces excluded, as in _MatchSentenceKeywords, so rows join with sentences.parquet
+            spanstarts = spanstarts + [
+                len(sentence) - len(sentence.lstrip())
+                for sentence in (content[start:end] for start, end in zip(spanstarts, spanends))
+            ]
+            rows.append(pd.DataFrame({
+                'doc': docidx, 'sentence': np.arange(len(spanstarts)), 'start': spanstarts, 'end': spanends
+            }))
+
+    docs = np.concatenate(docs) if docs else np.zeros(0, dtype=np.int64)
+    columns = np.concatenate(columns) if columns else np.zeros(0, dtype=np.int64)
+    if level == 'document':
+        rowidx = docs
+        rows = pd.DataFrame({'doc': np.arange(ndocs)})
+    else:
+        rows = pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(columns=['doc', 'sentence', 'start', 'end'])
+        ### (doc, sentence) of each hit -> position in rows
+        hitkeys = pd.MultiIndex.from_arrays([docs, np.concatenate(sentenceends) if sentenceends else docs])
+        rowidx = pd.MultiIndex.from_frame(rows[['doc', 'sentence']]).get_indexer(hitkeys)
+        rows = rows.drop(columns='sentence')
+
+    ### duplicated (row, keyword) pairs are summed
+    matrix = sparse.coo_matrix(
+        (np.ones(len(columns), dtype=np.int32), (rowidx, columns)),
+        shape=(len(rows), len(matcher.keywords)),
+    ).tocsr()
+    matrix.sum_duplicates()
+    return matrix, rows, list(matcher.keywords)
+
+def _AggregateRows(matrix, groups):
+    '''
+    Sum rows of a count matrix by group, e.g. sentences -> documents, or sections -> filings
+
+    Parameters:
+    ------------
+    matrix: scipy.sparse matrix
+    groups: array-like, the group of each row
+
+    Returns:
+    ------------
+    (scipy.sparse.csr_matrix, np.ndarray of groups in the order of the rows of the result)
+    '''
+    labels, groupidx = np.unique(np.asarray(groups), return_inverse=True)
+    indicator = sparse.csr_matrix(
+        (np.ones(len(groupidx), dtype=matrix.dtype), (groupidx, np.arange(len(groupidx)))),
+        shape=(len(labels), matrix.shape[0]),
+    )
+    return (indicator @ matrix).tocsr(), labels
+
+def _SaveKeywordMatrix(fname, matrix, rows, keywords):
+    '''
+    Save a count matrix with its row table and keywords in one compressed npz file
+    '''
+    matrix = matrix.tocsr()
+    arrays = {f'row_{col}': rows[col].to_numpy() for col in rows.columns}
+    np.savez_compressed(
+        fname,
+        data=matrix.data, indices=matrix.indices, indptr=matrix.indptr, shape=np.array(matrix.shape),
+        keywords=np.array(keywords, dtype=str), **arrays
+    )
+
+def _LoadKeywordMatrix(fname):
+    '''
+    Load a count matrix saved by _SaveKeywordMatrix
+
+    Returns:
+    ------------
+    matrix, rows, keywords - as returned by _KeywordMatrix
+    '''
+    with np.load(fname, allow_pickle=False) as npz:
+        matrix = sparse.csr_matrix((npz['data'], npz['indices'], npz['indptr']), shape=tuple(npz['shape']))
+        rows = pd.DataFrame({key[4:]: npz[key] for key in npz.files if key.startswith('row_')})
+        keywords = npz['keywords'].tolist()
+    return matrix, rows, keywords
+
+def _ReadTexts(paths):
+    '''
+    Read text files one at a time, missing files are read as empty texts
+    '''
+    for path in paths:
+        try:
+            with _openfile_(path, 'r', encoding='utf-8') as fp:
+                yield fp.read()
+        except FileNotFoundError:
+            print(f'[info] {path} not found')
+            yield ''
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Count keywords of a corpus into a sparse matrix')
+    parser.add_argument('matching', type=str, help='Pickle with columns fileidx and itemseven_folder, e.g. Matching_Files.pickle')
+    parser.add_argument('keywords', type=str, help='Keyword list, one keyword per line')
+    parser.add_argument('out', type=str, help='Path for the matrix (npz)')
+    parser.add_argument('--txtname', type=str, default='Item7.txt', help='Name of the text file in each folder')
+    parser.add_argument('--level', type=str, default='document', choices={'document', 'sentence'}, help='Rows of the matrix')
+
+    args = parser.parse_args()
+
+    matchingdf = pd.read_pickle(args.matching)
+    with open(args.keywords) as fp:
+        keywords = [line.strip() for line in fp if line.strip()]
+    paths = matchingdf['itemseven_folder'].astype(str) + '/' + args.txtname
+    matrix, rows, keywords = _KeywordMatrix(_ReadTexts(paths), keywords, args.level)
+    rows['fileidx'] = matchingdf['fileidx'].to_numpy()[rows['doc'].to_numpy()]
+    _SaveKeywordMatrix(args.out, matrix, rows, keywords)
+    print(f'[info] {matrix.shape[0]} x {matrix.shape[1]} matrix with {matrix.nnz} non-zero counts saved to {args.out}')
@@ -1,36 +1,10 @@
+from utils import _openfile_
 import pandas as pd
+import numpy as np
 import re
 
-### compile the format
-class _Numberiter(object):
-    def __init__(self, start = 1, prefix='NUMBERREBMUN'):
-        self.count = start - 1
-        self.prefix = prefix
-        
-    def __call__(self, match):
-        self.count += 1
-        return f"{self.prefix}_{self.count}"
-
-
-def _Rereplacenumber(content, prefix='NUMBERREBMUN'):
-    '''
-    Replace all number(with decimals) into a string without decimal
-    
-    and return a dataframe that containes the replacement information
-    '''
-    pattern = re.compile(r'\d+\.\d+')
-    ### make dataframe for replacement information
-    count = 1
-    replacementdf = []
-    for match in pattern.finditer(content):
-        replacementdf.append((f'{prefix}_{count}', match.group()))
-        count += 1
-    replacementdf = pd.DataFrame(replacementdf, columns=['REWORD', 'ORIGIN_NUM'])
-    ### replacement the data
-    newcontent = re.sub(pattern, _Numberiter(prefix=prefix), content)
-    return newcontent, replacementdf
-    
-    
+### a sentence ends at `!`, `?`, a new line, or a `.` that is not a decimal point
+SENTENCE_END = re.compile(r'[!?\n]|(?<!\d)\.|\.(?!\d)')
 
 def _Rekeywordsentence(keyword):
     '''
@@ -48,33 +22,246 @@ def _RekeywordsPattern(keywords):
         patterns.append(_Rekeywordsentence(keyword))
     return '|'.join(patterns)
 
-def _replaceSUBstr(sentence, replacementdf, prefix='NUMBERREBMUN'):
-    '''
-    Change back to a number 
-    '''
-    ### We here use the most unefficient way to do so
-    if sentence.count(prefix) != 0:
-        prefixpattern = re.compile(r'{}_[\d]'.format(prefix))
-        SUBstrings = re.findall(prefixpattern, sentence)
-        for substring in SUBstrings:
-            ### get the number back
-            number = replacementdf[replacementdf['REWORD'] == substring].iloc[0]['ORIGIN_NUM']
-            sentence = sentence.replace(substring, str(number))
-            
-    return sentence
-
-def _MatchSentences(content, keywordspattern, prefix='NUMBERREBMUN'):
-    ### replace the number first
-    newcontent, replacementdf = _Rereplacenumber(content)
-    ### Find sentences that contain our keywords
-    rawsentences = re.findall(keywordspattern, newcontent)
-    
-    ### Clean these sentences with dataframe
-    sentences = []
-    for RAWsentence in rawsentences:
-        sentences.append(_replaceSUBstr(RAWsentence, replacementdf))
-        
-    return sentences
+class _KeywordsTrie(object):
+    '''
+    All keywords compiled into one trie and one trie-shaped Re, case insensitive,
+    with flexible spaces between single words (as in _Rekeywordsentence), keywords are literal strings
+
+    the Re shares common prefixes (e.g. `climate risk|climate change` -> `climate\\s*(?:risk|change)`),
+    so the text is scanned once instead of once per keyword at every character;
+    the break between two words is an edge of its own (a ` ` child, `\\s*` in the Re),
+    so it is only allowed on the way to keywords that have it (`climates` does not match `climate s`)
+    '''
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        self.root = self._newnode()
+        for idx, keyword in enumerate(self.keywords):
+            node = self.root
+            for wordidx, word in enumerate(keyword.lower().split()):
+                if wordidx > 0:
+                    node = node['children'].setdefault(' ', self._newnode())
+                for char in word:
+                    node = node['children'].setdefault(char, self._newnode())
+            node['keywords'].append(idx)
+        regex = self._regex(self.root)
+        ### longest keyword from a position
+        self.pattern = re.compile(regex, re.IGNORECASE)
+        ### every position where a keyword starts, including overlapping ones (keywords are found by _walk)
+        self.overlap = re.compile(r'(?={})'.format(regex), re.IGNORECASE)
+
+    @staticmethod
+    def _newnode():
+        return {'children': {}, 'keywords': []}
+
+    def _regex(self, node):
+        alternatives = [
+            (r'\s*' if char == ' ' else re.escape(char)) + self._regex(child)
+            for char, child in node['children'].items()
+        ]
+        if not alternatives:
+            return ''
+        regex = alternatives[0] if len(alternatives) == 1 else '(?:{})'.format('|'.join(alternatives))
+        if node['keywords']:
+            regex = '(?:{})?'.format(regex)
+        return regex
+
+    def finditer(self, content):
+        '''Non-overlapping longest matches, like re.Pattern.finditer'''
+        return self.pattern.finditer(content)
+
+    def _hits(self, content):
+        '''
+        All keyword occurrences in one pass, overlapping ones included (`risk` in `climate risk`)
+
+        Returns:
+        ------------
+        positions, keywordidx: np.ndarray - start of each occurrence and the index of its keyword
+        '''
+        positions, _, keywordidx = self._hitspans(content)
+        return positions, keywordidx
+
+    def _hitspans(self, content):
+        '''
+        As _hits, with the end of each occurrence
+
+        Returns:
+        ------------
+        positions, ends, keywordidx: np.ndarray
+        '''
+        positions = []; ends = []; keywordidx = []
+        for match in self.overlap.finditer(content):
+            for end, idx in self._walk(content, match.start()):
+                positions.append(match.start()); ends.append(end); keywordidx.append(idx)
+        return (
+            np.array(positions, dtype=np.int64), np.array(ends, dtype=np.int64), np.array(keywordidx, dtype=np.int64)
+        )
+
+    def _walk(self, content, start):
+        '''
+        Walk every branch of the trie the text from `start` allows (a word break may be spaces or nothing),
+        not only the branch the Re took, so keywords sharing a prefix across a word break are all found
+
+        Yields:
+        ------------
+        (end, keyword index) of each keyword starting at `start`
+        '''
+        ### states are (node, whether the node was reached by a word break and may take more spaces)
+        states = [(self.root, False)]
+        for charidx in range(start, len(content)):
+            char = content[charidx].lower()
+            nextstates = {}
+            for node, inspace in states:
+                if char.isspace():
+                    if inspace:
+                        nextstates[id(node), True] = (node, True)
+                    elif ' ' in node['children']:
+                        child = node['children'][' ']
+                        nextstates[id(child), True] = (child, True)
+                    continue
+                if char in node['children']:
+                    child = node['children'][char]
+                    nextstates[id(child), False] = (child, False)
+                if not inspace and ' ' in node['children'] and char in node['children'][' ']['children']:
+                    ### words written without a space between them
+                    child = node['children'][' ']['children'][char]
+                    nextstates[id(child), False] = (child, False)
+            if not nextstates:
+                return
+            states = list(nextstates.values())
+            for node, inspace in states:
+                if not inspace:
+                    for idx in node['keywords']:
+                        yield charidx + 1, idx
+
+def _RekeywordsMatcher(keywords):
+    '''
+    A matcher for any of the keywords (not the sentence), see _KeywordsTrie
+    '''
+    return _KeywordsTrie(keywords)
+
+def _SentenceSpans(content):
+    '''
+    Segment content into sentences in one pass, decimals (e.g. 3.5) are not split
+
+    Returns:
+    ------------
+    starts, ends: np.ndarray - sentence i is content[starts[i]:ends[i]] (with its stop character)
+    '''
+    ends = np.fromiter((match.end() for match in SENTENCE_END.finditer(content)), dtype=np.int64)
+    if len(content) > 0 and (len(ends) == 0 or ends[-1] < len(content)):
+        ends = np.append(ends, len(content))
+    starts = np.concatenate([np.zeros(min(len(ends), 1), dtype=np.int64), ends[:-1]])
+    return starts, ends
+
+def _HitSentences(starts, ends, hitstarts, hitends):
+    '''
+    Sentences of keyword occurrences, an occurrence running over a sentence end
+    (e.g. `carbon\nemissions`) joins the sentences it spans into one
+
+    Parameters:
+    ------------
+    starts, ends: np.ndarray
+        from _SentenceSpans
+    hitstarts, hitends: np.ndarray
+        span of each occurrence
+
+    Returns:
+    ------------
+    hitsentence: np.ndarray - the matched sentence of each occurrence, as an index into spanstarts/spanends
+    spanstarts, spanends: np.ndarray - matched (joined) sentences in the order of the content
+    '''
+    firstidx = np.searchsorted(ends, hitstarts, side='right')
+    lastidx = np.searchsorted(ends, hitends - 1, side='right')
+    ### sentence i is joined to sentence i+1 if an occurrence runs over its end
+    joins = np.zeros(len(ends) + 1, dtype=np.int64)
+    np.add.at(joins, firstidx, 1); np.add.at(joins, lastidx, -1)
+    joinnext = np.cumsum(joins[:len(ends)]) > 0
+    group = np.concatenate([np.zeros(min(len(ends), 1), dtype=np.int64), np.cumsum(~joinnext[:-1])])
+    groups, hitsentence = np.unique(group[firstidx], return_inverse=True)
+    spanstarts = starts[np.searchsorted(group, groups, side='left')]
+    spanends = ends[np.searchsorted(group, groups, side='right') - 1]
+    return hitsentence.reshape(-1), spanstarts, spanends
+
+def _MatchSentenceSpans(content, keywordsmatcher):
+    '''
+    Find sentences that contain keywords, as spans into the untouched content
+
+    Parameters:
+    ------------
+    content: str
+    keywordsmatcher: _KeywordsTrie or re.Pattern
+        from _RekeywordsMatcher
+
+    Returns:
+    ------------
+    np.ndarray of shape (n, 2) - (start, end) of each matched sentence, leading spaces excluded
+    '''
+    starts, ends = _SentenceSpans(content)
+    hits = np.array([match.span() for match in keywordsmatcher.finditer(content)], dtype=np.int64).reshape(-1, 2)
+    _, spanstarts, spanends = _HitSentences(starts, ends, hits[:, 0], hits[:, 1])
+    spans = np.stack([spanstarts, spanends], axis=1)
+    for span in spans:
+        sentence = content[span[0]:span[1]]
+        span[0] += len(sentence) - len(sentence.lstrip())
+    return spans
+
+def _MatchSentenceKeywords(content, keywordsmatcher):
+    '''
+    Find sentences that contain keywords, and which keywords each of them contains
+
+    Parameters:
+    ------------
+    content: str
+    keywordsmatcher: _KeywordsTrie
+        from _RekeywordsMatcher
+
+    Returns:
+    ------------
+    pd.DataFrame with columns start, end (span into content) and keywords (list of matched keywords)
+    '''
+    starts, ends = _SentenceSpans(content)
+    positions, hitends, keywordidx = keywordsmatcher._hitspans(content)
+    hitsentence, spanstarts, spanends = _HitSentences(starts, ends, positions, hitends)
+    hits = pd.DataFrame({
+        'sentenceidx': hitsentence,
+        'keyword': np.array(keywordsmatcher.keywords, dtype=object)[keywordidx],
+    })
+    matched = hits.drop_duplicates().groupby('sentenceidx', sort=True)['keyword'].agg(list)
+    sentenceidx = matched.index.to_numpy()
+    result = pd.DataFrame({'start': spanstarts[sentenceidx], 'end': spanends[sentenceidx], 'keywords': matched.to_numpy()})
+    result['start'] += [
+        len(sentence) - len(sentence.lstrip())
+        for sentence in (content[start:end] for start, end in zip(result['start'], result['end']))
+    ]
+    return result
+
+def _MatchSentences(content, keywordsmatcher):
+    '''
+    Sentences that contain keywords, see _MatchSentenceSpans
+    '''
+    return [content[start:end] for start, end in _MatchSentenceSpans(content, keywordsmatcher)]
+
+### (keywords, content, keywords found in each matched sentence) - keywords sharing a prefix across a word break
+TRIE_CASES = [
+    (['abx', 'a by'], 'aby.', [['a by']]),
+    (['greenhouses', 'green house gas'], 'greenhouse gas.', [['green house gas']]),
+    (['greenhouse gases', 'green house gas'], 'Our greenhouse gas output fell.', [['green house gas']]),
+    (['a b', 'abc d'], 'abc d.', [['a b', 'abc d']]),
+    (['climate risk', 'climates'], 'Our climate sized tents. Climate\nrisk rose.', [['climate risk']]),
+]
+
+def _CheckKeywordsTrie(cases=TRIE_CASES):
+    '''
+    Regression check of _KeywordsTrie: keywords per sentence from _MatchSentenceKeywords,
+    and the same sentences from _MatchSentences
+    '''
+    for keywords, content, expected in cases:
+        matcher = _RekeywordsMatcher(keywords)
+        result = _MatchSentenceKeywords(content, matcher)
+        found = [sorted(sentencekeywords) for sentencekeywords in result['keywords']]
+        assert found == [sorted(sentencekeywords) for sentencekeywords in expected], (keywords, content, found)
+        assert _MatchSentences(content, matcher) == [content[s:e] for s, e in zip(result['start'], result['end'])], (keywords, content)
+    print(f'[info] {len(cases)} keyword trie cases passed')
 
 if __name__ == '__main__':
     matchingdf = pd.read_pickle('./Matching_Files.pickle')
@@ -86,8 +273,7 @@ if __name__ == '__main__':
             wordraw = fpline.strip()
             longlist.append(wordraw)
 
-    keywordspatternstr = _RekeywordsPattern(longlist)
-    pattern = re.compile(keywordspatternstr, re.IGNORECASE)
+    pattern = _RekeywordsMatcher(longlist)
     
     sentence_numbers = []
     notes = []
@@ -95,7 +281,7 @@ if __name__ == '__main__':
         print('*'*80)
         print('Matching Sentences From {}'.format(row['fileidx']))
         itemsevenfile = '{}/Item7.txt'.format(row['itemseven_folder'])
-        with open(itemsevenfile, encoding='utf-8') as fp:
+        with _openfile_(itemsevenfile, 'r', encoding='utf-8') as fp:
             content = fp.read()
         try:
             sentences = _MatchSentences(content, pattern)